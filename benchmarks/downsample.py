@@ -0,0 +1,46 @@
+"""
+Chart payloads before and after ``utils.downsample``.
+
+Builds the Data Visualization Dashboard's "All" chart (five variables,
+melted to long format) from 1, 10 and 25 years of the bundled weather year
+and reports the Vega-Lite JSON size and how long the reduction takes.
+
+    python -m benchmarks.downsample
+"""
+import time
+
+import altair as alt
+
+from benchmarks.fixtures import weather_frame
+from utils.downsample import downsample
+
+alt.data_transformers.disable_max_rows()
+
+
+def all_variables_chart(long):
+    return alt.Chart(long).mark_line().encode(x="time:T", y="Value:Q", color="Variable:N")
+
+
+def run(years=1):
+    df = weather_frame(years).drop(columns="season").reset_index()
+    long = df.melt(id_vars=["time"], var_name="Variable", value_name="Value")
+
+    t0 = time.perf_counter()
+    reduced = downsample(long, "time", "Value", by="Variable")
+    t_reduce = time.perf_counter() - t0
+
+    full_json = all_variables_chart(long).to_json()
+    reduced_json = all_variables_chart(reduced).to_json()
+    return {
+        "years": years,
+        "rows": len(long),
+        "rows_sent": len(reduced),
+        "downsample_ms": round(1000 * t_reduce, 1),
+        "full_MB": round(len(full_json) / 2 ** 20, 2),
+        "reduced_MB": round(len(reduced_json) / 2 ** 20, 3),
+    }
+
+
+if __name__ == "__main__":
+    for years in (1, 10, 25):
+        print(run(years))
@@ -0,0 +1,37 @@
+"""
+Bytes per row of an Elhub production frame before and after ``compact_frame``.
+
+"Before" is what the pages used to hold: ``pd.DataFrame(list(find()))``
+with ``_id`` and every Elhub field, and ``starttime`` parsed to UTC.
+
+    python -m benchmarks.elhub_memory [scale ...]
+"""
+import sys
+
+import pandas as pd
+
+from benchmarks.fixtures import elhub_docs
+from utils.elhub import compact_frame
+
+
+def bytes_per_row(df):
+    return float(df.memory_usage(deep=True, index=True).sum()) / max(len(df), 1)
+
+
+def run(scale):
+    before = pd.DataFrame(elhub_docs(scale))
+    before["starttime"] = pd.to_datetime(before["starttime"], utc=True)
+    after = compact_frame(before, "productiongroup")
+    return {
+        "scale": scale,
+        "rows": len(before),
+        "before_bytes_per_row": round(bytes_per_row(before), 1),
+        "after_bytes_per_row": round(bytes_per_row(after), 1),
+        "ratio": round(bytes_per_row(before) / bytes_per_row(after), 1),
+    }
+
+
+if __name__ == "__main__":
+    scales = [int(s) for s in sys.argv[1:]] or [1, 10]
+    for scale in scales:
+        print(run(scale))
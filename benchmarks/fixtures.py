@@ -0,0 +1,79 @@
+"""
+Fixtures for the benchmarks.
+
+``weather_frame`` is the bundled ``open-meteo-subset.csv`` (one year of
+hourly ERA5 data, 8 760 rows) in the shape ``utils.weather`` returns,
+optionally repeated to cover several years.
+
+``elhub_docs`` mimics the documents stored in ``Elhub.Data`` (including
+``_id`` and the unused Elhub fields, with ISO-string timestamps), so
+benchmarks see the same shapes the pages receive from MongoDB. One unit
+of ``scale`` is 30 days of hourly data for 5 price areas × 5 groups
+(18 000 rows); ``duplicates`` appends that fraction of rows a second time,
+like the repeated readings the pages have to collapse.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from utils.weather import season_labels
+
+SUBSET_CSV = Path(__file__).resolve().parent.parent / "open-meteo-subset.csv"
+
+AREAS = ["NO1", "NO2", "NO3", "NO4", "NO5"]
+PRODUCTION_GROUPS = ["hydro", "wind", "solar", "thermal", "other"]
+HOURS_PER_SCALE = 30 * 24
+
+
+def elhub_frame(scale=1, group_field="productiongroup", groups=PRODUCTION_GROUPS, seed=0, duplicates=0.0):
+    """Hourly rows as a DataFrame with ISO-string timestamps (``_id`` excluded)."""
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2021-01-01", periods=HOURS_PER_SCALE * scale, freq="h", tz="Europe/Oslo")
+    n = len(hours) * len(AREAS) * len(groups)
+    area = np.repeat(AREAS, len(groups) * len(hours))
+    group = np.tile(np.repeat(groups, len(hours)), len(AREAS))
+    # Format each hour once; every (area, group) series repeats the same stamps
+    stamps = hours.strftime("%Y-%m-%dT%H:%M:%S%z")
+    stamps = np.tile(np.asarray(stamps.str[:-2] + ":" + stamps.str[-2:], dtype=object),
+                     len(AREAS) * len(groups))
+    df = pd.DataFrame({
+        "pricearea": area,
+        group_field: group,
+        "starttime": stamps,
+        "endtime": stamps,
+        "lastupdatedtime": "2024-12-31T12:00:00+01:00",
+        "quantitykwh": rng.gamma(2.0, 50_000.0, n),
+    })
+    if duplicates:
+        repeated = df.sample(frac=duplicates, random_state=seed)
+        df = pd.concat([df, repeated], ignore_index=True)
+    return df
+
+
+def elhub_docs(scale=1, group_field="productiongroup", groups=PRODUCTION_GROUPS, seed=0):
+    """The same rows as ``elhub_frame`` as Mongo-style dicts with an ``_id``."""
+    docs = elhub_frame(scale, group_field, groups, seed).to_dict("records")
+    for doc in docs:
+        doc["_id"] = ObjectId()
+    return docs
+
+
+def weather_frame(years=1, timezone="Europe/Oslo", start="2020-01-01"):
+    """Hourly weather indexed by local time, with a July–June ``season`` column.
+
+    ``years > 1`` repeats the CSV year back to back on a continuous hourly
+    index beginning at ``start``.
+    """
+    csv = pd.read_csv(SUBSET_CSV)
+    csv.columns = [c.split(" (")[0] for c in csv.columns]
+    values = csv.drop(columns="time")
+    start = pd.Timestamp(start, tz=timezone)
+    end = start + pd.DateOffset(years=years)
+    index = pd.date_range(start, end, freq="h", inclusive="left", name="time")
+    reps = -(-len(index) // len(values))
+    df = pd.concat([values] * reps, ignore_index=True).iloc[:len(index)]
+    df.index = index
+    df["season"] = season_labels(index)
+    return df
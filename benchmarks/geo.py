@@ -0,0 +1,67 @@
+"""
+Click → price-area lookup: linear scan over the GeoJSON versus ``utils.geo``.
+
+The scan is what the Map and Snowdrift pages did on every click: rebuild
+each polygon with ``shape()`` and test ``contains`` until one matches.
+
+    python -m benchmarks.geo [n_points]
+"""
+import sys
+import time
+
+import numpy as np
+from shapely.geometry import MultiPolygon, Point, Polygon, shape
+
+from utils.geo import get_area_index
+
+
+def linear_scan(geojson_data, lat, lon):
+    point = Point(lon, lat)
+    for i, feat in enumerate(geojson_data.get("features", [])):
+        geom = shape(feat["geometry"])
+        if isinstance(geom, (Polygon, MultiPolygon)) and geom.contains(point):
+            return i
+    return None
+
+
+def random_points(n, seed=0):
+    """Points over the bounding box of mainland Norway (many fall in the sea or Sweden)."""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(57.5, 71.5, n), rng.uniform(4.0, 31.5, n)
+
+
+def run(n_points=1000):
+    t0 = time.perf_counter()
+    index = get_area_index()
+    t_build = time.perf_counter() - t0
+
+    lats, lons = random_points(n_points)
+    n_scan = min(n_points, 200)
+
+    t0 = time.perf_counter()
+    scanned = [linear_scan(index.geojson, la, lo) for la, lo in zip(lats[:n_scan], lons[:n_scan])]
+    t_scan = (time.perf_counter() - t0) / n_scan
+
+    t0 = time.perf_counter()
+    single = [index.feature_at(la, lo) for la, lo in zip(lats, lons)]
+    t_single = (time.perf_counter() - t0) / n_points
+
+    t0 = time.perf_counter()
+    batch = index.features_at(lats, lons)
+    t_batch = time.perf_counter() - t0
+
+    assert single[:n_scan] == scanned
+    assert [None if i < 0 else int(i) for i in batch] == single
+    return {
+        "points": n_points,
+        "inside": int((batch >= 0).sum()),
+        "build_ms": round(1000 * t_build, 1),
+        "linear_scan_us_per_point": round(1e6 * t_scan, 1),
+        "index_us_per_point": round(1e6 * t_single, 1),
+        "batch_us_per_point": round(1e6 * t_batch / n_points, 2),
+        "speedup_single": round(t_scan / t_single, 1),
+    }
+
+
+if __name__ == "__main__":
+    print(run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,83 @@
+"""
+JSON versus binary (FlatBuffers) decoding of one year of hourly ERA5 data.
+
+Both bodies come from ``utils.fake_archive.FakeArchiveServer`` for the same
+location and year. Only the decoding is timed:
+
+    json     the old page code: ``r.json()["hourly"]`` into a DataFrame,
+             then ``pd.to_datetime`` over the timestamp strings
+    binary   ``WeatherApiResponse`` over the raw bytes and
+             ``utils.weather.hourly_frame`` (NumPy values, arithmetic time axis)
+
+    python -m benchmarks.ingest [repeats]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+
+from utils.fake_archive import FakeArchiveServer
+from utils.weather import HOURLY_VARIABLES, hourly_frame
+
+PARAMS = {
+    "latitude": 59.9139,
+    "longitude": 10.7522,
+    "start_date": "2021-01-01",
+    "end_date": "2021-12-31",
+    "hourly": HOURLY_VARIABLES,
+    "models": "era5",
+    "timezone": "Europe/Oslo",
+}
+
+
+def parse_json(body):
+    df = pd.DataFrame(json.loads(body)["hourly"])
+    df["time"] = pd.to_datetime(df["time"])
+    return df
+
+
+def parse_binary(body):
+    # Length-prefixed message, as the Open-Meteo client reads it
+    return hourly_frame(WeatherApiResponse.GetRootAs(body, 4))
+
+
+def best_of(fn, body, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(body)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def run(repeats=20):
+    with FakeArchiveServer() as server:
+        json_body = requests.get(server.url, params=PARAMS).content
+        binary_body = requests.get(server.url, params={**PARAMS, "format": "flatbuffers"}).content
+
+    from_json, from_binary = parse_json(json_body), parse_binary(binary_body)
+    assert len(from_json) == len(from_binary)
+    for name in HOURLY_VARIABLES:
+        # JSON carries two decimals, the binary message float32
+        np.testing.assert_allclose(from_json[name], from_binary[name], atol=0.006)
+
+    t_json = best_of(parse_json, json_body, repeats)
+    t_binary = best_of(parse_binary, binary_body, repeats)
+    return {
+        "hours": len(from_binary),
+        "json_kB": round(len(json_body) / 1024, 1),
+        "binary_kB": round(len(binary_body) / 1024, 1),
+        "json_ms": round(1000 * t_json, 2),
+        "binary_ms": round(1000 * t_binary, 2),
+        "speedup": round(t_json / t_binary, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("repeats", type=int, nargs="?", default=20)
+    print(run(parser.parse_args().repeats))
@@ -0,0 +1,333 @@
+"""
+Concurrent-user load test of the Streamlit pages.
+
+Each page is driven by N simultaneous sessions (``streamlit.testing.v1.AppTest``,
+one per thread, all sharing this process's caches and MongoDB client the
+way sessions of one ``streamlit run`` server do). A session renders the page,
+then reruns it after each scripted widget change from ``SCRIPTS``, so
+sessions ask for different cities, years and groups.
+
+External services are replaced by local stand-ins (``mongomock`` is a
+development requirement, see ``requirements-dev.txt``):
+
+    MongoDB     ``MONGO_URI`` when set (a local ``mongod``; its Elhub
+                collections are dropped and reseeded), otherwise an
+                in-memory ``mongomock`` client. The seed is
+                ``benchmarks.fixtures`` data with BSON dates; under mongomock,
+                which lacks ``$convert``, the pipelines pass ``starttime``
+                through unchanged.
+    Open-Meteo  ``utils.fake_archive.FakeArchiveServer``
+    stores      a fresh temporary directory (``--stores`` to reuse one)
+
+Reported per page: p50/p95/p99 rerun latency, reruns per second, failed
+reruns (and errors of AppTest itself, see ``session``), peak RSS while the
+page ran (and its growth over the start), and the median time per stage
+from the ``utils.timing`` spans.
+
+    python -m benchmarks.load --sessions 8 --reruns 5
+    python -m benchmarks.load --pages Map Snowdrift --sessions 16 --output load.json
+
+Pages run one after another in one process, so later pages start with the
+memory (and warm caches) of earlier ones; pass a single ``--pages`` entry
+for isolated RSS figures.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+PAGES_DIR = ROOT / "pages"
+STORE_VARIABLES = ["ERA5_STORE", "ELHUB_STORE", "STL_STORE", "GEO_STORE", "RESULTS_STORE"]
+
+
+# ======================================================
+# Scripted interactions
+# ======================================================
+def _widget(at, kind, label):
+    for w in getattr(at, kind):
+        if w.label == label:
+            return w
+    shown = "; ".join(e.value for e in at.error)
+    raise LookupError(f"no {kind} {label!r} on the page" + (f" (page shows: {shown})" if shown else ""))
+
+
+def cycle(kind, label, values=None):
+    """Step that sets widget ``label`` to the ``i``-th entry of ``values`` (default: its options)."""
+    def step(at, i):
+        w = _widget(at, kind, label)
+        options = values if values is not None else w.options
+        w.set_value(options[i % len(options)])
+    return step
+
+
+def pick(index_kind, label):
+    """Step that selects the ``i``-th option of a selectbox."""
+    def step(at, i):
+        w = _widget(at, index_kind, label)
+        w.select_index(i % len(w.options))
+    return step
+
+
+def click(key, points):
+    """Step that clicks the ``i``-th ``(lat, lon)`` of ``points`` on the ``st_folium`` map ``key``.
+
+    The click arrives as the map widget's value, the way the browser
+    component reports it, so the page's own click handling runs.
+    """
+    def step(at, i):
+        lat, lon = points[i % len(points)]
+        at.session_state[key] = {"last_clicked": {"lat": lat, "lng": lon}}
+    return step
+
+
+CLICKS = [(59.91, 10.75), (60.39, 5.32), (69.65, 18.96)]  # Oslo, Bergen, Tromsø
+
+# Page -> steps; rerun ``i`` of session ``k`` applies step ``(k + i) % len(steps)``
+SCRIPTS = {
+    "Data_Visualization_Dashboard": [pick("selectbox", "Select city:"), pick("selectbox", "Select variable:")],
+    "Columnwise_data_import": [pick("selectbox", "Select city:")],
+    "Extreme_Event_Analysis": [pick("selectbox", "Select city"),
+                               cycle("slider", "Proportion of anomalies (contamination)", [0.01, 0.02, 0.05]),
+                               cycle("number_input", "Select year", [2021, 2022])],
+    "Snowdrift": [click("snowdrift_map", CLICKS)],
+    "Analysis_of_Elhub_data": [pick("selectbox", "Select a month:")],
+    "Map": [pick("selectbox", "Select group:"), cycle("radio", "Select data type:"),
+            click("price_map", CLICKS)],
+    "Beautiful_STL_and_spectrogram": [pick("selectbox", "Select price area"),
+                                      pick("selectbox", "Select production group"),
+                                      cycle("number_input", "STL period (hours)", [24, 24 * 7])],
+    "Newpage": [pick("selectbox", "Select category")],
+}
+
+
+# ======================================================
+# Stand-ins
+# ======================================================
+def _pass_starttime(stage_fn):
+    """Wrap a pipeline builder so ``{"$convert": {"input": x, ...}}`` becomes ``x``."""
+    def strip(value):
+        if isinstance(value, dict):
+            if "$convert" in value:
+                return value["$convert"]["input"]
+            return {k: strip(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [strip(v) for v in value]
+        return value
+    return lambda *args, **kwargs: strip(stage_fn(*args, **kwargs))
+
+
+def seed_mongo(client, scale=1):
+    """Elhub production, consumption and example collections with BSON-date timestamps."""
+    import pandas as pd
+    from benchmarks.fixtures import PRODUCTION_GROUPS, elhub_frame
+    from utils.elhub import CONSUMPTION, EXAMPLE, PRODUCTION
+
+    consumption_groups = ["household", "cabin", "primary", "secondary", "tertiary"]
+    for (database, collection, group_field), groups in [(PRODUCTION, PRODUCTION_GROUPS),
+                                                         (CONSUMPTION, consumption_groups),
+                                                         (EXAMPLE, PRODUCTION_GROUPS)]:
+        df = elhub_frame(scale, group_field, groups, duplicates=0.01)
+        df["starttime"] = pd.to_datetime(df["starttime"], utc=True).dt.tz_localize(None)
+        target = client[database][collection]
+        target.drop()
+        target.insert_many(df.to_dict("records"))
+    return client
+
+
+def use_mongomock():
+    """Install an in-memory client as the shared ``utils.mongo`` client."""
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("Set MONGO_URI to a local mongod or `pip install mongomock`.")
+    from utils import elhub, mongo
+
+    elhub.project_stage = _pass_starttime(elhub.project_stage)
+    elhub.catalog_pipeline = _pass_starttime(elhub.catalog_pipeline)
+    mongo._client = mongomock.MongoClient()
+    return mongo._client
+
+
+# ======================================================
+# Measurement
+# ======================================================
+def current_rss():
+    """Resident set size in bytes (Linux ``/proc``), else the process peak so far."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Background thread recording the peak RSS between ``start`` and ``stop``."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start_bytes = self.peak_bytes = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, current_rss())
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, current_rss())
+        return False
+
+
+def session(page, k, reruns, timeout):
+    """One user: first render plus ``reruns`` scripted reruns.
+
+    Returns ``(latencies, failures, harness_errors)``: exceptions shown by
+    the page, and errors raised by AppTest or a scripted step. AppTest is
+    not built for concurrent sessions and occasionally loses a run's
+    elements (seen when sessions wait on the same cache entry); the session
+    then starts over as a new user.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    steps = SCRIPTS.get(page, [])
+    at = AppTest.from_file(str(PAGES_DIR / f"{page}.py"), default_timeout=timeout)
+    latencies, failures, harness_errors = [], [], []
+    for i in range(reruns + 1):
+        try:
+            if i and steps:
+                steps[(k + i) % len(steps)](at, k + i)
+            t0 = time.perf_counter()
+            at.run()
+            latencies.append(time.perf_counter() - t0)
+        except Exception as e:  # the harness, not the page; go on as a fresh session
+            harness_errors.append(repr(e))
+            at = AppTest.from_file(str(PAGES_DIR / f"{page}.py"), default_timeout=timeout)
+            continue
+        if at.exception:
+            exc = at.exception[0]
+            # The innermost frame locates the failure in the page or ``utils``
+            where = [line.strip() for line in exc.stack_trace if line.strip().startswith("File ")]
+            failures.append(exc.message + (f" at {where[-1]}" if where else ""))
+    return latencies, failures, harness_errors
+
+
+def stage_medians(log_path, page):
+    """Median wall time per stage over this page's traces in the span log."""
+    per_trace = defaultdict(lambda: defaultdict(float))
+    if not log_path.exists():
+        return {}
+    with open(log_path) as f:
+        for line in f:
+            r = json.loads(line)
+            a = r["attributes"]
+            if a.get("page") == page and r["parent_span_id"] is None:
+                per_trace[r["trace_id"]][a["stage"]] += a["duration_ms"]
+    stages = {s for t in per_trace.values() for s in t}
+    return {s: round(float(np.median([t.get(s, 0.0) for t in per_trace.values()])), 1) for s in sorted(stages)}
+
+
+def run_page(page, sessions, reruns, timeout=120, log_path=None):
+    with RssSampler() as rss, ThreadPoolExecutor(max_workers=sessions) as pool:
+        t0 = time.perf_counter()
+        results = list(pool.map(lambda k: session(page, k, reruns, timeout), range(sessions)))
+        wall = time.perf_counter() - t0
+
+    latencies = np.array([x for lat, _, _ in results for x in lat]) * 1000
+    failures = [e for _, errors, _ in results for e in errors]
+    harness_errors = [e for _, _, errors in results for e in errors]
+    percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [np.nan] * 3
+    result = {
+        "page": page,
+        "sessions": sessions,
+        "reruns": len(latencies),
+        "failed": len(failures),
+        "harness_errors": len(harness_errors),
+        "p50_ms": round(float(percentiles[0]), 1),
+        "p95_ms": round(float(percentiles[1]), 1),
+        "p99_ms": round(float(percentiles[2]), 1),
+        "reruns_per_s": round(len(latencies) / wall, 2),
+        "peak_rss_MB": round(rss.peak_bytes / 2 ** 20, 1),
+        "rss_growth_MB": round((rss.peak_bytes - rss.start_bytes) / 2 ** 20, 1),
+        "errors": sorted(set(failures + harness_errors))[:5],
+    }
+    if log_path is not None:
+        result["stage_p50_ms"] = stage_medians(log_path, page.replace("_", " "))
+    return result
+
+
+# ======================================================
+# Runner
+# ======================================================
+def run_load(pages, sessions=8, reruns=5, timeout=120, mongo_scale=1):
+    """Seed the stand-ins and load every page in turn; returns the JSON report."""
+    # The timing log and stores are read from the environment when ``utils`` is imported
+    log_path = Path(os.environ["PAGE_TIMING_LOG"])
+
+    from benchmarks.suite import environment
+    from utils import weather
+    from utils.fake_archive import FakeArchiveServer
+    from utils.mongo import get_client
+
+    uri = os.environ.get("MONGO_URI")
+    if uri and uri.startswith("mongodb+srv://"):
+        raise SystemExit("MONGO_URI must be a local mongod: its Elhub collections are dropped and reseeded.")
+    client = get_client() if uri else use_mongomock()
+    seed_mongo(client, mongo_scale)
+
+    results = []
+    with FakeArchiveServer() as server:
+        weather.ARCHIVE_URL = server.url
+        for page in pages:
+            result = run_page(page, sessions, reruns, timeout, log_path)
+            print(f"{page:30s} p50 {result['p50_ms']:>8.0f}  p95 {result['p95_ms']:>8.0f}  "
+                  f"p99 {result['p99_ms']:>8.0f} ms  {result['reruns_per_s']:>6.2f}/s  "
+                  f"rss {result['peak_rss_MB']:>7.1f} MB  failed {result['failed']}"
+                  f" ({result['harness_errors']} harness)", file=sys.stderr)
+            results.append(result)
+        archive_requests = len(server.requests)
+    return {"environment": environment(), "archive_requests": archive_requests, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", nargs="+", choices=sorted(SCRIPTS), default=sorted(SCRIPTS))
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions per page")
+    parser.add_argument("--reruns", type=int, default=5, help="scripted reruns per session")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per rerun")
+    parser.add_argument("--mongo-scale", type=int, default=1, help="units of 30 days of Elhub data")
+    parser.add_argument("--stores", help="directory for the local stores (default: a new temporary one)")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    stores = Path(args.stores or tempfile.mkdtemp(prefix="load-"))
+    for name in STORE_VARIABLES:
+        os.environ[name] = str(stores / name.lower())
+    os.environ["PAGE_TIMING_LOG"] = str(stores / "spans.jsonl")
+    # The pages open relative paths (GeoJSON, CSV) from the repository root
+    os.chdir(ROOT)
+
+    report = run_load(args.pages, args.sessions, args.reruns, args.timeout, args.mongo_scale)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
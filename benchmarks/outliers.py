@@ -0,0 +1,126 @@
+"""
+Outlier detection benchmarks on the bundled weather year.
+
+Temperature: the Extreme Event page's per-series filter + SPC (reference
+copy below, without the plot) run in a loop over cities × years, versus one
+``utils.outliers.detect_temperature_outliers`` call.
+
+Precipitation: scikit-learn's ``LocalOutlierFactor`` versus the sorted 1-D
+LOF on the wet hours of 1, 10 and 25 years (the CSV year plus noise at the
+data's 0.1 mm resolution), with identical labels required.
+
+    python -m benchmarks.outliers [n_cities] [n_years]
+    python -m benchmarks.outliers --lof
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.signal import butter, filtfilt
+from sklearn.neighbors import LocalOutlierFactor
+
+from benchmarks.fixtures import weather_frame
+from utils.outliers import detect_temperature_outliers, local_outlier_factor_1d, lof_predict_1d
+
+
+# ------------------- Reference implementation -------------------
+def legacy_temperature_outliers(s, cutoff_hours=400, sample_rate_hours=1, n_std=2.0):
+    s = s.dropna().sort_index()
+    x = s.values.astype(float)
+    nyquist = 0.5 / sample_rate_hours
+    normal_cutoff = (1 / cutoff_hours) / nyquist
+    b, a = butter(N=4, Wn=normal_cutoff, btype="low", analog=False)
+    trend = filtfilt(b, a, x)
+    residual = x - trend
+    sigma_hat = 1.4826 * np.median(np.abs(residual - np.median(residual)))
+    upper = trend + n_std * sigma_hat
+    lower = trend - n_std * sigma_hat
+    mask = (x > upper) | (x < lower)
+    return pd.DataFrame({"temperature": x[mask]}, index=s.index[mask])
+
+
+# ------------------- Benchmark -------------------
+def city_years(n_cities=5, n_years=26, seed=0):
+    """``{(city, year): temperature}`` built from the CSV year plus per-city noise."""
+    rng = np.random.default_rng(seed)
+    df = weather_frame(n_years, start="2000-01-01")
+    temp = df["temperature_2m"].astype(float)
+    out = {}
+    for c in range(n_cities):
+        noisy = temp + rng.normal(0, 1.0, len(temp))
+        for year, s in noisy.groupby(noisy.index.year):
+            out[(f"city{c}", year)] = s
+    return out
+
+
+def run_temperature(n_cities=5, n_years=26):
+    series = city_years(n_cities, n_years)
+
+    t0 = time.perf_counter()
+    old = {k: legacy_temperature_outliers(s) for k, s in series.items()}
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fits = detect_temperature_outliers(series)
+    t_batch = time.perf_counter() - t0
+
+    for key, table in old.items():
+        fit = fits[key]
+        assert table.index.equals(fit.index[fit["outlier"].to_numpy()])
+        np.testing.assert_allclose(fit.loc[fit["outlier"], "temperature"], table["temperature"])
+    return {
+        "series": len(series),
+        "hours": sum(len(s) for s in series.values()),
+        "outliers": int(sum(f["outlier"].sum() for f in fits.values())),
+        "loop_ms": round(1000 * t_loop, 1),
+        "batched_ms": round(1000 * t_batch, 1),
+        "speedup": round(t_loop / t_batch, 1),
+    }
+
+
+def wet_hours(years, seed=0):
+    """log1p of the non-zero hourly precipitation, rounded to 0.1 mm like the archive."""
+    rng = np.random.default_rng(seed)
+    p = weather_frame(years)["precipitation"].to_numpy(dtype=float)
+    p = np.round(np.clip(p + rng.normal(0, 0.2, len(p)) * (p > 0), 0, None), 1)
+    return np.log1p(p[p > 0])
+
+
+def run_lof(years=1, contamination=0.01):
+    x = wet_hours(years)
+    k = min(len(x) - 1, 20)
+
+    t0 = time.perf_counter()
+    lof = LocalOutlierFactor(n_neighbors=k, contamination=contamination)
+    expected = lof.fit_predict(x.reshape(-1, 1))
+    t_sklearn = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    labels = lof_predict_1d(x, contamination, k)
+    t_sorted = time.perf_counter() - t0
+
+    assert np.array_equal(labels, expected)
+    np.testing.assert_allclose(local_outlier_factor_1d(x, k), lof.negative_outlier_factor_, rtol=1e-12)
+    return {
+        "years": years,
+        "wet_hours": len(x),
+        "distinct": len(np.unique(x)),
+        "outliers": int((labels == -1).sum()),
+        "sklearn_ms": round(1000 * t_sklearn, 1),
+        "sorted_1d_ms": round(1000 * t_sorted, 1),
+        "speedup": round(t_sklearn / t_sorted, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("n_cities", type=int, nargs="?", default=5)
+    parser.add_argument("n_years", type=int, nargs="?", default=26)
+    parser.add_argument("--lof", action="store_true", help="precipitation LOF on 1, 10 and 25 years instead")
+    a = parser.parse_args()
+    if a.lof:
+        for years in (1, 10, 25):
+            print(run_lof(years))
+    else:
+        print(run_temperature(a.n_cities, a.n_years))
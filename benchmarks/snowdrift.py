@@ -0,0 +1,172 @@
+"""
+Old per-hour snow-drift loops versus the NumPy engine in ``utils.snowdrift``.
+
+The ``legacy_*`` functions are the implementations that used to live in
+``pages/Snowdrift.py``, kept verbatim as the reference. The old page parsed
+Open-Meteo's local time strings with ``utc=True``, so its frames held local
+wall-clock times labelled UTC; ``legacy_frame`` rebuilds that shape, which
+puts the old ``tz='UTC'`` season bounds on the same local midnights the
+new engine uses.
+
+    python -m benchmarks.snowdrift [years]
+    python -m benchmarks.snowdrift --scaling
+
+``--scaling`` times the season labelling and the per-season reductions for
+1 to 30 complete July–June seasons; the new path should grow linearly
+(constant time per hour), the old one with seasons × hours.
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fixtures import weather_frame
+from utils import snowdrift
+from utils.weather import season_labels
+
+T, F, THETA = 3000, 30000, 0.5
+
+
+# ------------------- Reference implementation -------------------
+def legacy_compute_Qupot(hourly_wind_speeds, dt=3600):
+    total = sum((u ** 3.8) * dt for u in hourly_wind_speeds) / 233847
+    return total
+
+def legacy_sector_index(direction):
+    return int(((direction + 11.25) % 360) // 22.5)
+
+def legacy_compute_sector_transport(hourly_wind_speeds, hourly_wind_dirs, dt=3600):
+    sectors = [0.0] * 16
+    for u, d in zip(hourly_wind_speeds, hourly_wind_dirs):
+        idx = legacy_sector_index(d)
+        sectors[idx] += ((u ** 3.8) * dt) / 233847
+    return sectors
+
+def legacy_compute_snow_transport(T, F, theta, Swe, hourly_wind_speeds, dt=3600):
+    Qupot = legacy_compute_Qupot(hourly_wind_speeds, dt)
+    Qspot = 0.5 * T * Swe
+    Srwe = theta * Swe
+    if Qupot > Qspot:
+        Qinf = 0.5 * T * Srwe
+        control = "Snowfall controlled"
+    else:
+        Qinf = Qupot
+        control = "Wind controlled"
+    Qt = Qinf * (1 - 0.14 ** (F / T))
+    return {"Qupot": Qupot, "Qspot": Qspot, "Srwe": Srwe, "Qinf": Qinf, "Qt": Qt, "Control": control}
+
+def legacy_compute_yearly_results(df, T, F, theta):
+    seasons = sorted(df['season'].unique())
+    results_list = []
+    for s in seasons:
+        # Make timestamps UTC-aware
+        season_start = pd.Timestamp(year=s, month=7, day=1, tz='UTC')
+        season_end = pd.Timestamp(year=s+1, month=6, day=30, hour=23, minute=59, second=59, tz='UTC')
+        df_season = df[(df.index >= season_start) & (df.index <= season_end)].copy()
+        if df_season.empty:
+            continue
+        df_season.loc[:, 'Swe_hourly'] = df_season.apply(
+            lambda row: row['precipitation'] if row['temperature_2m'] < 1 else 0, axis=1
+        )
+        total_Swe = df_season['Swe_hourly'].sum()
+        wind_speeds = df_season["wind_speed_10m"].tolist()
+        result = legacy_compute_snow_transport(T, F, theta, total_Swe, wind_speeds)
+        result["season"] = f"{s}-{s+1}"
+        results_list.append(result)
+    return pd.DataFrame(results_list)
+
+def legacy_compute_average_sector(df):
+    sectors_list = []
+    for s, group in df.groupby('season'):
+        group = group.copy()
+        group.loc[:, 'Swe_hourly'] = group.apply(
+            lambda row: row['precipitation'] if row['temperature_2m'] < 1 else 0, axis=1
+        )
+        ws = group["wind_speed_10m"].tolist()
+        wdir = group["wind_direction_10m"].tolist()
+        sectors = legacy_compute_sector_transport(ws, wdir)
+        sectors_list.append(sectors)
+    return np.mean(sectors_list, axis=0)
+
+
+def legacy_frame(df):
+    """``df`` as the old page loaded it: the same local wall-clock times, labelled UTC."""
+    return df.set_axis(df.index.tz_localize(None).tz_localize("UTC"))
+
+
+# ------------------- Benchmark -------------------
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def check_identical(old, new):
+    numeric = ["Qupot", "Qspot", "Srwe", "Qinf", "Qt"]
+    assert list(old["season"]) == list(new["season"])
+    assert list(old["Control"]) == list(new["Control"])
+    np.testing.assert_allclose(new[numeric].to_numpy(float), old[numeric].to_numpy(float), rtol=1e-9)
+
+
+def run(years=1):
+    df = weather_frame(years)
+    old_df = legacy_frame(df)
+    t_old_y, old_y = best_of(lambda: legacy_compute_yearly_results(old_df, T, F, THETA), repeat=1)
+    t_new_y, new_y = best_of(lambda: snowdrift.compute_yearly_results(df, T, F, THETA))
+    t_old_s, old_s = best_of(lambda: legacy_compute_average_sector(old_df), repeat=1)
+    t_new_s, new_s = best_of(lambda: snowdrift.compute_average_sector(df))
+
+    check_identical(old_y, new_y)
+    np.testing.assert_allclose(new_s, old_s, rtol=1e-9)
+    return {
+        "years": years,
+        "rows": len(df),
+        "yearly_results_old_s": round(t_old_y, 4),
+        "yearly_results_new_s": round(t_new_y, 5),
+        "average_sector_old_s": round(t_old_s, 4),
+        "average_sector_new_s": round(t_new_s, 5),
+        "speedup": round((t_old_y + t_old_s) / (t_new_y + t_new_s), 1),
+    }
+
+
+def legacy_season_labels(df):
+    return df.index.to_series().apply(lambda dt: dt.year if dt.month >= 7 else dt.year - 1)
+
+
+def scaling(seasons=(1, 2, 5, 10, 20, 30), legacy_up_to=10):
+    """Timings per number of seasons; the legacy path is only run for small sizes."""
+    rows = []
+    for n in seasons:
+        df = weather_frame(n, start="2020-07-01")
+        t_label, _ = best_of(lambda: season_labels(df.index))
+        t_new, new = best_of(lambda: snowdrift.compute_yearly_results(df, T, F, THETA))
+        row = {
+            "seasons": n,
+            "rows": len(df),
+            "label_new_ms": round(1000 * t_label, 3),
+            "yearly_new_ms": round(1000 * t_new, 3),
+            "yearly_new_ns_per_row": round(1e9 * t_new / len(df), 1),
+        }
+        if n <= legacy_up_to:
+            t_label_old, _ = best_of(lambda: legacy_season_labels(df), repeat=1)
+            old_df = legacy_frame(df)
+            t_old, old = best_of(lambda: legacy_compute_yearly_results(old_df, T, F, THETA), repeat=1)
+            check_identical(old, new)
+            row.update({
+                "label_old_ms": round(1000 * t_label_old, 1),
+                "yearly_old_ms": round(1000 * t_old, 1),
+                "yearly_old_ns_per_row": round(1e9 * t_old / len(df), 1),
+            })
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--scaling"]:
+        print(scaling().to_string(index=False))
+    else:
+        print(run(int(sys.argv[1]) if len(sys.argv) > 1 else 1))
@@ -0,0 +1,98 @@
+"""
+Per-series ``scipy.signal.spectrogram`` versus the batched engine in
+``utils.spectrogram``, plus the old gouraud rendering versus the decimated
+plotly heat map.
+
+    python -m benchmarks.spectrogram [n_series] [years] [repeats]
+
+Times are the best of ``repeats`` runs; the batched engine starts from an
+empty cache on every run.
+"""
+import io
+import sys
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from scipy import signal
+
+from utils import spectrogram as spec
+
+NPERSEG = 24 * 7
+
+
+def hourly_series(n_series, years, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2021-01-01", periods=int(years * 8760), freq="h", tz="UTC")
+    hours = np.arange(len(index))
+    daily = np.sin(2 * np.pi * hours / 24)
+    return [pd.Series(1000 + 300 * daily * rng.uniform(0.5, 1.5) + rng.normal(0, 50, len(index)), index=index)
+            for _ in range(n_series)]
+
+
+def render_gouraud(f, t, Sxx):
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.pcolormesh(t, f, 10 * np.log10(Sxx + 1e-12), shading="gouraud")
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    plt.close(fig)
+    return buf.getbuffer().nbytes
+
+
+def render_heatmap(result, max_columns=900):
+    times, freqs, db = result.decimated(max_columns)
+    fig = go.Figure(go.Heatmap(x=times, y=freqs, z=db.astype(np.float32)))
+    return len(fig.to_json())
+
+
+def best_of(repeats, fn, setup=None):
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def run(n_series=25, years=1, repeats=5):
+    series = hourly_series(n_series, years)
+
+    t_scipy, reference = best_of(repeats, lambda: [
+        signal.spectrogram(s.to_numpy(), fs=1.0, window="hann", nperseg=NPERSEG, noverlap=NPERSEG // 2)
+        for s in series])
+    t_batch, batched = best_of(repeats, lambda: spec.spectrograms(series, NPERSEG), setup=spec._cache.clear)
+    t_cached, _ = best_of(repeats, lambda: spec.spectrograms(series, NPERSEG))
+
+    for (f, t, Sxx), result in zip(reference, batched):
+        np.testing.assert_allclose(result.freqs, f)
+        np.testing.assert_allclose(result.power, Sxx, rtol=1e-9, atol=1e-12)
+
+    t0 = time.perf_counter()
+    png_bytes = render_gouraud(*reference[0])
+    t_gouraud = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    json_bytes = render_heatmap(batched[0])
+    t_heatmap = time.perf_counter() - t0
+
+    return {
+        "series": n_series,
+        "hours_per_series": len(series[0]),
+        "scipy_loop_ms": round(1000 * t_scipy, 1),
+        "batched_ms": round(1000 * t_batch, 1),
+        "cached_ms": round(1000 * t_cached, 2),
+        "gouraud_png_ms": round(1000 * t_gouraud, 1),
+        "gouraud_png_kB": round(png_bytes / 1024, 1),
+        "heatmap_ms": round(1000 * t_heatmap, 1),
+        "heatmap_json_kB": round(json_bytes / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    print(run(*args))
@@ -0,0 +1,238 @@
+"""
+Benchmark suite for the analysis hot paths.
+
+Every case runs headless, with no Streamlit session, network or MongoDB, on
+the fixtures in ``benchmarks.fixtures``. ``scale`` means years of the
+bundled weather CSV for the weather kernels and units of the synthetic
+Elhub generator (30 days × 25 series, 1 % repeated rows) for the Elhub
+ones. Each case reports the best and median wall time over ``--repeats``
+runs, and the whole run is written as JSON so two runs can be compared:
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json
+    python -m benchmarks.suite --only elhub --scales 1 10 100
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fixtures import elhub_frame, weather_frame
+from utils import spectrogram as spec
+from utils import stl
+from utils.elhub import compact_frame
+from utils.elhub_cube import build_cube
+from utils.outliers import detect_precipitation_outliers, detect_temperature_outliers
+from utils.snowdrift import (
+    compute_average_sector,
+    compute_snow_transport,
+    compute_yearly_results,
+    swe_hourly,
+)
+from utils.snowdrift_grid import F, T, THETA
+
+SCALES = [1, 10, 100]
+CASES = {}
+
+
+def case(name, max_scale=None):
+    """Register ``setup(scale) -> (rows, run)`` as a benchmark case.
+
+    Cases whose cost makes larger scales impractical set ``max_scale``.
+    """
+    def register(setup):
+        CASES[name] = (setup, max_scale)
+        return setup
+    return register
+
+
+# ======================================================
+# Fixtures (built once per scale)
+# ======================================================
+@lru_cache(maxsize=None)
+def weather(scale):
+    return weather_frame(scale)
+
+
+@lru_cache(maxsize=None)
+def elhub_raw(scale):
+    return elhub_frame(scale, duplicates=0.01)
+
+
+@lru_cache(maxsize=None)
+def elhub_compact(scale):
+    return compact_frame(elhub_raw(scale), "productiongroup")
+
+
+@lru_cache(maxsize=None)
+def production_series(scale):
+    """Hourly total of one price area, as the STL and spectrogram tabs plot it."""
+    df = elhub_compact(scale)
+    df = df[df["pricearea"] == "NO1"]
+    return df.groupby("starttime")["quantitykwh"].sum().astype("float64")
+
+
+# ======================================================
+# Cases
+# ======================================================
+@case("snowdrift.compute_snow_transport")
+def _snow_transport(scale):
+    df = weather(scale)
+    return len(df), lambda: compute_snow_transport(T, F, THETA, swe_hourly(df).sum(), df["wind_speed_10m"])
+
+
+@case("snowdrift.compute_yearly_results")
+def _yearly_results(scale):
+    df = weather(scale)
+    return len(df), lambda: compute_yearly_results(df, T, F, THETA)
+
+
+@case("snowdrift.compute_average_sector")
+def _average_sector(scale):
+    df = weather(scale)
+    return len(df), lambda: compute_average_sector(df)
+
+
+@case("outliers.temperature")
+def _temperature_outliers(scale):
+    temp = weather(scale)["temperature_2m"]
+    return len(temp), lambda: detect_temperature_outliers({"temperature_2m": temp})
+
+
+@case("outliers.precipitation_lof")
+def _precipitation_lof(scale):
+    precip = weather(scale)["precipitation"]
+    return len(precip), lambda: detect_precipitation_outliers(precip, 0.01)
+
+
+@case("stl.fit", max_scale=10)
+def _stl_fit(scale):
+    series = stl.prepare_series(production_series(scale))
+    return len(series), lambda: stl._fit(series, 24 * 7, True)
+
+
+@case("spectrogram.compute")
+def _spectrogram(scale):
+    series = production_series(scale)
+
+    def run():
+        spec._cache.clear()
+        return spec.spectrogram(series).decimated()
+    return len(series), run
+
+
+@case("elhub.compact_frame")
+def _compact(scale):
+    raw = elhub_raw(scale)
+    return len(raw), lambda: compact_frame(raw, "productiongroup")
+
+
+@case("elhub.dedupe_sum_rollup")
+def _cube_sum(scale):
+    df = elhub_compact(scale)
+    return len(df), lambda: build_cube(df, "productiongroup", dedupe="sum")
+
+
+@case("elhub.dedupe_first_rollup")
+def _cube_first(scale):
+    df = elhub_compact(scale)
+    return len(df), lambda: build_cube(df, "productiongroup", dedupe="first")
+
+
+@case("elhub.hourly_by_group")
+def _hourly_by_group(scale):
+    cube = build_cube(elhub_compact(scale), "productiongroup")
+    return len(cube.hourly), lambda: cube.hourly_by_group(1, areas=["NO1", "NO2"])
+
+
+# ======================================================
+# Runner
+# ======================================================
+def time_case(run, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "created": pd.Timestamp.now(tz="UTC").isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def run_suite(scales=SCALES, repeats=5, only=None):
+    results = []
+    for name, (setup, max_scale) in CASES.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        for scale in scales:
+            if max_scale is not None and scale > max_scale:
+                continue
+            rows, run = setup(scale)
+            run()  # warm-up: imports, filter design, first-touch allocations
+            times = time_case(run, repeats)
+            result = {
+                "case": name,
+                "scale": scale,
+                "rows": int(rows),
+                "best_ms": round(1000 * min(times), 3),
+                "median_ms": round(1000 * statistics.median(times), 3),
+                "repeats": repeats,
+            }
+            print(f"{name:34s} x{scale:<4d} {rows:>10d} rows  {result['best_ms']:>10.2f} ms",
+                  file=sys.stderr)
+            results.append(result)
+    return {"environment": environment(), "results": results}
+
+
+def compare(current, baseline):
+    """``(case, scale, baseline_ms, current_ms, ratio)`` for every case in both runs."""
+    before = {(r["case"], r["scale"]): r["best_ms"] for r in baseline["results"]}
+    return [(r["case"], r["scale"], before[(r["case"], r["scale"])], r["best_ms"],
+             r["best_ms"] / before[(r["case"], r["scale"])])
+            for r in current["results"] if (r["case"], r["scale"]) in before]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="case name prefixes, e.g. snowdrift elhub")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON output to compare against")
+    args = parser.parse_args()
+
+    report = run_suite(args.scales, args.repeats, args.only)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name, scale, before_ms, after_ms, ratio in compare(report, baseline):
+            print(f"{name:34s} x{scale:<4d} {before_ms:>10.2f} -> {after_ms:>10.2f} ms  ({ratio:.2f}x)",
+                  file=sys.stderr)
@@ -1,43 +1,33 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
-import certifi
 import plotly.express as px
+from utils.elhub import PRODUCTION
+from utils.downsample import CHART_WIDTH, downsample
+from utils.elhub_cube import get_cube
+from utils.timing import cached, page_trace, render_timing_panel, span
 
 # -------------------------------
-# CACHE DATA LOADING
+# CACHED ROLLUP CUBE
 # -------------------------------
-@st.cache_data(show_spinner="Loading data from MongoDB...")
-def load_data():
-    """Load data from MongoDB with caching."""
-    uri = st.secrets["mongo"]["uri"]
-    ca = certifi.where()
-    client = MongoClient(uri, tls=True, tlsCAFile=ca)
-    db = client['Elhub']
-    collection = db['Data']
-
-    data = list(collection.find())
-    if not data:
-        return pd.DataFrame()  # Empty DataFrame fallback
-
-    df = pd.DataFrame(data)
-    df["starttime"] = pd.to_datetime(df["starttime"])
-
-    # Remove duplicates (fix NO1 duplicate issue)
-    df = df.drop_duplicates(subset=["pricearea", "productiongroup", "starttime"], keep="first").reset_index(drop=True)
-    return df
+@cached("fetch", st.cache_resource(show_spinner="Syncing Elhub data and building rollups...", ttl=3600))
+def load_cube():
+    """Production rollups (duplicates removed, keep first), rebuilt when new data arrives."""
+    return get_cube(PRODUCTION, dedupe="first")
 
 
 # -------------------------------
-# LOAD DATA
+# LOAD OPTIONS
 # -------------------------------
-df = load_data()
+trace = page_trace("Analysis of Elhub data")
+cube = load_cube()
+price_areas, production_groups = cube.areas, cube.groups
 
-if df.empty:
+if not price_areas:
     st.error("No data found in MongoDB.")
     st.stop()
 
-st.caption(f"✅ Loaded {len(df)} unique records after removing duplicates (cached).")
+st.caption(f"✅ {len(price_areas)} price areas and {len(production_groups)} production groups "
+           "(duplicates removed, precomputed rollups).")
 
 
 # -------------------------------
@@ -52,7 +42,7 @@ group_colors = {
 }
 
 # Add fallback colors for unexpected groups
-for group in df["productiongroup"].unique():
+for group in production_groups:
     if group not in group_colors:
         group_colors[group] = px.colors.qualitative.Pastel1[
             len(group_colors) % len(px.colors.qualitative.Pastel1)
@@ -75,7 +65,6 @@ with col1:
     selected_areas = []
 
     # Arrange checkboxes horizontally
-    price_areas = df["pricearea"].unique()
     n_cols = min(4, len(price_areas))
     rows = (len(price_areas) + n_cols - 1) // n_cols
     for r in range(rows):
@@ -89,8 +78,8 @@ with col1:
         st.warning("Please select at least one price area.")
         st.stop()
 
-    df_area = df[df["pricearea"].isin(selected_areas)]
-    total_by_group = df_area.groupby("productiongroup")["quantitykwh"].sum().reset_index()
+    with span("compute", "total_by_group"):
+        total_by_group = cube.total_by(["productiongroup"], areas=selected_areas)
 
     # Pie chart
     fig_pie = px.pie(
@@ -104,7 +93,8 @@ with col1:
         height=600
     )
     fig_pie.update_traces(textposition="inside", textinfo="percent+label")
-    st.plotly_chart(fig_pie, use_container_width=True)
+    with span("render", "pie_chart") as s:
+        st.plotly_chart(s.payload(fig_pie), use_container_width=True)
 
 
 # -------------------------------
@@ -116,8 +106,8 @@ with col2:
     # Production group selection (pills style)
     prod_groups_selected = st.multiselect(
         "Select production group(s):",
-        df["productiongroup"].unique(),
-        default=df["productiongroup"].unique()
+        production_groups,
+        default=production_groups
     )
 
     # Month selection
@@ -127,34 +117,31 @@ with col2:
         format_func=lambda x: pd.to_datetime(f"2021-{x}-01").strftime("%B")
     )
 
-    # Filter and aggregate data
-    df_filtered = df_area[
-        (df_area["productiongroup"].isin(prod_groups_selected)) &
-        (df_area["starttime"].dt.month == month)
-    ]
+    # Filter and SUM UP across price areas (month slice of the hourly rollup)
+    with span("compute", "hourly_by_group"):
+        df_sum = cube.hourly_by_group(month, areas=selected_areas, groups=prod_groups_selected)
 
-    if df_filtered.empty:
+    if df_sum.empty:
         st.warning("No data for this selection.")
     else:
-        # --- SUM UP across price areas ---
-        df_sum = (
-            df_filtered
-            .groupby(["starttime", "productiongroup"], as_index=False)["quantitykwh"].sum().sort_values("starttime"))
-
         # --- Create the line chart ---
+        # One LTTB-reduced line per production group (missing hours are kept as gaps)
+        with span("compute", "downsample"):
+            df_line = downsample(df_sum, "starttime", "quantitykwh", by="productiongroup")
         fig_line = px.line(
-            df_sum,
+            df_line,
             x="starttime",
             y="quantitykwh",
             color="productiongroup",
             markers=True,
             color_discrete_map=group_colors,
             title=f"Total Hourly Production ({pd.to_datetime(f'2021-{month}-01').strftime('%B')})",
-            width=900,
+            width=CHART_WIDTH,
             height=500
         )
         fig_line.update_traces(connectgaps=False)
-        st.plotly_chart(fig_line, use_container_width=True)
+        with span("render", "line_chart") as s:
+            st.plotly_chart(s.payload(fig_line), use_container_width=True)
 
 
 # -------------------------------
@@ -166,3 +153,5 @@ with st.expander("ℹ️ Data Source"):
     production by price area and production group. It’s stored in MongoDB and visualized here interactively.
     Update
     """)
+
+render_timing_panel(trace)
@@ -4,97 +4,103 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from statsmodels.tsa.seasonal import STL
-from scipy import signal
-from pymongo.mongo_client import MongoClient
-import certifi
+from matplotlib.figure import Figure
+import plotly.graph_objects as go
+from utils.elhub import distinct_values
+from utils.mongo import get_database
+from utils import stl
+from utils.spectrogram import spectrogram
+from utils.timing import cached, page_trace, render_timing_panel, span
 
 # ======================================================
-# 1) Load data from MongoDB (cached)
+# 1) Load data from MongoDB (aggregated server-side, cached)
 # ======================================================
-@st.cache_data(show_spinner="Loading data from MongoDB...")
-def load_data():
-    """Load data from MongoDB with caching, aggregate duplicates, produce time series."""
-    uri = st.secrets["mongo"]["uri"]
-    ca = certifi.where()
-    client = MongoClient(uri, tls=True, tlsCAFile=ca)
-    db = client['example']
-    collection = db['data']
+def get_collection():
+    return get_database('example')['data']
 
-    data = list(collection.find())
-    if not data:
-        return pd.DataFrame()  # Empty DataFrame fallback
+@cached("fetch", st.cache_data(show_spinner="Loading price areas and production groups..."))
+def load_options():
+    """Distinct price areas and production groups."""
+    collection = get_collection()
+    return distinct_values(collection, "pricearea"), distinct_values(collection, "productiongroup")
 
-    df = pd.DataFrame(data)
-    df["starttime"] = pd.to_datetime(df["starttime"])
+@cached("fetch", st.cache_data(show_spinner="Loading data from MongoDB..."))
+def load_series(area=None, group=None):
+    """Hourly quantitykwh for one price area and production group, or summed over all of them.
 
-    # Aggregate duplicates by summing quantities
-    df = df.groupby(["pricearea", "productiongroup", "starttime"], as_index=False).agg({"quantitykwh": "sum"})
-
-    # Set datetime index for time series
-    df.set_index("starttime", inplace=True)
-
-    return df
+    Duplicates are summed inside MongoDB, so only one value per hour is transferred.
+    """
+    return stl.load_series(get_collection(), area, group)
 
 # ======================================================
 # 2) STL decomposition
 # ======================================================
-def stl_decompose_series(series, period=24*7, title="STL Decomposition"):
-    """Perform STL decomposition on a time series."""
-    series = series.sort_index()
-
-    # Handle timezone
-    if series.index.tz is not None:
-        series = series.tz_convert("UTC")
-    else:
-        series.index = series.index.tz_localize("UTC")
-
-    # Regularize to hourly frequency
-    series = series.asfreq("h")
-    series = series.interpolate(method="time")
+@cached("compute", st.cache_data(show_spinner="Loading STL decomposition..."))
+def stl_components(series, period):
+    """Trend/seasonal/residual from the content-addressed store (computed on a miss)."""
+    return stl.decompose(series, period=period)
 
-    # STL
-    stl = STL(series, period=period, robust=True)
-    result = stl.fit()
-
-    # Plot
-    fig = result.plot()
-    fig.set_size_inches(14, 10)
-    fig.suptitle(f"{title}\n{series.name}", fontsize=12)
-    plt.tight_layout()
-    st.pyplot(fig)
-
-    return result
+def stl_decompose_series(series, period=24*7, title="STL Decomposition"):
+    """Plot the stored STL decomposition of a time series."""
+    components = stl_components(series, period)
+
+    with span("render", "stl_figure"):
+        # A bare Figure, not pyplot: pyplot's current figure is shared by every session
+        fig = Figure(figsize=(14, 10))
+        axes = fig.subplots(4, 1, sharex=True)
+        for ax, name in zip(axes, stl.COMPONENTS):
+            if name == "resid":
+                ax.plot(components.index, components[name], marker="o", linestyle="none", markersize=2)
+                ax.axhline(0, color="#000000", zorder=-3)
+            else:
+                ax.plot(components.index, components[name])
+            ax.set_ylabel(name.capitalize())
+        fig.suptitle(f"{title}\n{series.name}", fontsize=12)
+        fig.tight_layout()
+        st.pyplot(fig)
+
+    return components
 
 # ======================================================
 # 3) Spectrogram
 # ======================================================
-def plot_spectrogram(series, fs=1.0, nperseg=24*7, noverlap=None):
-    """Plot the spectrogram of a time series."""
-    s = series.dropna().astype(float)
-    noverlap = noverlap or nperseg // 2
-    f, t, Sxx = signal.spectrogram(s.values, fs=fs, window="hann", nperseg=nperseg, noverlap=noverlap)
-
-    fig, ax = plt.subplots(figsize=(10, 5))
-    pcm = ax.pcolormesh(t, f, 10 * np.log10(Sxx + 1e-12), shading="gouraud")
-    ax.set_title("Spectrogram (dB scale)")
-    ax.set_xlabel("Window index")
-    ax.set_ylabel("Frequency [cycles/hour]")
-    plt.colorbar(pcm, ax=ax, label="dB")
-    plt.tight_layout()
-    st.pyplot(fig)
-
-    return f, t, Sxx
+def plot_spectrogram(series, fs=1.0, nperseg=24*7, noverlap=None, max_columns=1000):
+    """Plot the spectrogram of a time series as a heat map over real timestamps.
+
+    Power matrices are cached by ``utils.spectrogram``; the plotted grid is
+    reduced to at most ``max_columns`` time columns.
+    """
+    with span("compute", "spectrogram"):
+        result = spectrogram(series, nperseg=nperseg, noverlap=noverlap, fs=fs)
+    if result is None:
+        st.warning(f"Need at least {nperseg} hourly values for this window size.")
+        return None
+
+    times, freqs, db = result.decimated(max_columns)
+    fig = go.Figure(go.Heatmap(
+        x=times, y=freqs, z=db.astype(np.float32),
+        colorscale="Viridis", colorbar=dict(title="dB"),
+    ))
+    fig.update_layout(
+        title="Spectrogram (dB scale)",
+        xaxis_title="Time (window centre, UTC)",
+        yaxis_title="Frequency [cycles/hour]",
+        height=450,
+    )
+    with span("render", "spectrogram_heatmap") as s:
+        st.plotly_chart(s.payload(fig), use_container_width=True)
+
+    return result.freqs, result.times, result.power
 
 # ======================================================
 # 4) Streamlit UI
 # ======================================================
 st.title("NewA Analysis: STL & Spectrogram")
+trace = page_trace("Beautiful STL and spectrogram")
 
-# Load data
-df = load_data()
-if df.empty:
+# Load options
+priceareas, prod_groups = load_options()
+if not priceareas:
     st.warning("No data found in MongoDB.")
     st.stop()
 
@@ -103,18 +109,14 @@ use_all = st.checkbox("Use all data (aggregate over price area and production gr
 
 if use_all:
     # Aggregate all data
-    series = df.groupby(df.index)["quantitykwh"].sum()
+    series = load_series()
 else:
     # Select price area & production group
-    priceareas = df["pricearea"].unique()
-    prod_groups = df["productiongroup"].unique()
-
     selected_area = st.selectbox("Select price area", priceareas)
     selected_group = st.selectbox("Select production group", prod_groups)
 
     # Filter data
-    df_area = df[(df["pricearea"] == selected_area) & (df["productiongroup"] == selected_group)]
-    series = df_area["quantitykwh"]
+    series = load_series(selected_area, selected_group)
 
 # Tabs for analysis
 tab1, tab2 = st.tabs(["STL Decomposition", "Spectrogram"])
@@ -128,3 +130,5 @@ with tab2:
     st.header("Spectrogram")
     nperseg = st.number_input("Window size (nperseg)", min_value=1, value=24*7)
     plot_spectrogram(series, nperseg=nperseg)
+
+render_timing_panel(trace)
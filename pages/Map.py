@@ -1,45 +1,27 @@
-import re
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
-import json
-from shapely.geometry import shape, Point, Polygon, MultiPolygon
-from pymongo import MongoClient
-import certifi
 import pandas as pd
 import branca
+from utils.elhub import PRODUCTION, CONSUMPTION, normalize_to_NO
+from utils.elhub_cube import get_cube
+from utils.geo import get_area_index, load_level, tolerance_for_zoom
+from utils.timing import cached, page_trace, render_timing_panel, span, timed
 
 st.set_page_config(layout="wide")
 st.title("Norway Price Areas Map – Elhub Data (NO1–NO5)")
+trace = page_trace("Map")
 
 # ==============================================================================
-# Load GeoJSON
+# Load GeoJSON (parsed and indexed once per process)
 # ==============================================================================
-geojson_path = "file.geojson"  # <-- replace if needed
-with open(geojson_path, "r", encoding="utf-8") as f:
-    geojson_data = json.load(f)
+with span("parse", "area_index"):
+    area_index = get_area_index("file.geojson")
+geojson_data = area_index.geojson
 
 # ==============================================================================
 # Normalization helpers
 # ==============================================================================
-def normalize_to_NO(code):
-    if code is None:
-        return None
-    if isinstance(code, int):
-        return f"NO{code}"
-    s = str(code).strip().upper()
-    s = re.sub(r"[^A-Z0-9]", "", s)
-    m = re.match(r"^N0?([1-9])$", s)
-    if m:
-        return f"NO{m.group(1)}"
-    m2 = re.match(r"^NO0?([1-9])$", s)
-    if m2:
-        return f"NO{m2.group(1)}"
-    m3 = re.match(r"^0?([1-9])$", s)
-    if m3:
-        return f"NO{m3.group(1)}"
-    return None
-
 def extract_geojson_area(feature):
     props = feature.get("properties", {})
     candidates = ["ElSpotOmr", "Elspot_omr", "ELSPOT_OMR", "ElSpotOmråde", "ELSPOT_OMRADE"]
@@ -55,9 +37,13 @@ def extract_geojson_area(feature):
                 break
     return normalize_to_NO(raw)
 
-geo_feature_area = {}
-for i, feat in enumerate(geojson_data.get("features", [])):
-    geo_feature_area[i] = extract_geojson_area(feat)
+@cached("parse", st.cache_resource(show_spinner=False))
+def feature_areas(path):
+    """Normalized area of every GeoJSON feature, by feature index (once per process)."""
+    features = get_area_index(path).geojson.get("features", [])
+    return {i: extract_geojson_area(feat) for i, feat in enumerate(features)}
+
+geo_feature_area = feature_areas("file.geojson")
 
 # ==============================================================================
 # Session state
@@ -68,66 +54,41 @@ if "selected_area" not in st.session_state:
     st.session_state.selected_area = None
 if "area_means" not in st.session_state:
     st.session_state.area_means = {}
+if "map_view" not in st.session_state:
+    st.session_state.map_view = {"center": [63.0, 10.5], "zoom": 5.4}
 
 # ==============================================================================
-# MongoDB Loaders
+# Rollup cubes (synced from MongoDB, rebuilt when new data arrives)
 # ==============================================================================
-@st.cache_data(show_spinner="Loading production data...")
-def load_production():
-    client = MongoClient(st.secrets["mongo"]["uri"], tls=True, tlsCAFile=certifi.where())
-    db = client["Elhub"]
-    df = pd.DataFrame(list(db["Data"].find()))
-    
-    if df.empty:
-        return df
-
-    # Convert starttime to datetime safely
-    df["starttime"] = pd.to_datetime(df["starttime"], errors="coerce", utc=True)
-    df = df.dropna(subset=["starttime"])
-
-    # Normalize pricearea
-    if "pricearea" in df.columns:
-        df["pricearea"] = df["pricearea"].apply(normalize_to_NO)
+DATASETS = {"Production": PRODUCTION, "Consumption": CONSUMPTION}
 
-    # Aggregate quantitykwh per unique combination
-    df = df.groupby(["pricearea", "productiongroup", "starttime"], as_index=False).agg({"quantitykwh": "sum"})
+@cached("fetch", st.cache_resource(show_spinner="Syncing Elhub data and building rollups...", ttl=3600))
+def load_cube(data_type):
+    return get_cube(DATASETS[data_type], dedupe="sum")
 
-    # Set starttime as index (required for your later computations)
-    df.set_index("starttime", inplace=True)
+@timed("compute")
+def compute_area_means(cube, group, year):
+    """Mean hourly quantitykwh per price area for one group and year (duplicates summed).
 
-    return df
-
-@st.cache_data(show_spinner="Loading consumption data...")
-def load_consumption():
-    client = MongoClient(st.secrets["mongo"]["uri"], tls=True, tlsCAFile=certifi.where())
-    db = client["Consumption_Elhub"]
-    df = pd.DataFrame(list(db["Data"].find()))
+    The cube already unifies area spellings before collapsing each hour, so
+    every NO area is one cube key and its mean is over all of its rows.
+    """
+    df = cube.mean_by(["pricearea"], groups=[group], year=year)
     if df.empty:
-        return df
-    df["starttime"] = pd.to_datetime(df["starttime"], utc=True)
-    if "pricearea" in df.columns:
-        df["pricearea"] = df["pricearea"].apply(normalize_to_NO)
-    df = df.groupby(["pricearea", "consumptiongroup", "starttime"], as_index=False).agg({"quantitykwh": "sum"})
-    df.set_index("starttime", inplace=True)
-    return df
+        return {}
 
-prod_df = load_production()
-cons_df = load_consumption()
+    df = df[df["pricearea"].astype(str).isin([f"NO{i}" for i in range(1, 10)])]
+    return dict(zip(df["pricearea"].astype(str), df["quantitykwh"]))
 
 # ==============================================================================
 # User selections
 # ==============================================================================
 data_type = st.radio("Select data type:", ["Production", "Consumption"], horizontal=True)
-df = prod_df if data_type == "Production" else cons_df
-group_col = "productiongroup" if data_type == "Production" else "consumptiongroup"
 
-if df.empty or group_col not in df.columns:
-    st.warning("No data available (empty dataframe or missing group column). Check DB and secrets.")
-    st.stop()
-
-groups = sorted(df[group_col].dropna().unique())
+cube = load_cube(data_type)
+groups = sorted(cube.groups)
 if not groups:
-    st.warning("No groups found in the data.")
+    st.warning("No groups found in the data. Check DB and secrets.")
     st.stop()
 
 selected_group = st.selectbox("Select group:", groups)
@@ -138,27 +99,7 @@ selected_year = st.selectbox("Select year:", [2021, 2022, 2023, 2024])
 # ==============================================================================
 # Compute mean per area
 # ==============================================================================
-def compute_area_means():
-    df_group = df[df[group_col] == selected_group].copy()
-    if df_group.empty:
-        return {}
-
-    # Ensure index is DatetimeIndex
-    if not isinstance(df_group.index, pd.DatetimeIndex):
-        df_group.index = pd.to_datetime(df_group.index)
-
-    df_group["year"] = df_group.index.year
-    df_year = df_group[df_group["year"] == selected_year]
-    if df_year.empty:
-        return {}
-
-    df_year["pricearea"] = df_year["pricearea"].apply(normalize_to_NO)
-    df_year = df_year[df_year["pricearea"].notna()]
-
-    means = df_year.groupby("pricearea")["quantitykwh"].mean().to_dict()
-    return means
-
-st.session_state.area_means = compute_area_means()
+st.session_state.area_means = compute_area_means(cube, selected_group, selected_year)
 area_means = st.session_state.area_means
 
 if not area_means:
@@ -173,74 +114,110 @@ sample_map = {i: v for i, v in list(geo_feature_area.items())}
 st.sidebar.json(sample_map)
 
 # ==============================================================================
-# Color scale using branca
-# ==============================================================================
-vals = list(area_means.values())
-vmin, vmax = min(vals), max(vals)
-colormap = branca.colormap.LinearColormap(
-    colors=["#d73027", "#fee08b", "#1a9850"],  # red -> yellow -> green
-    vmin=vmin, vmax=vmax,
-    caption=f"Mean quantity kWh for {selected_group} ({selected_year})"
-)
-
-# ==============================================================================
-# Build folium map
+# Click handler
 # ==============================================================================
-m = folium.Map(location=[63.0, 10.5], zoom_start=5.4, tiles="OpenStreetMap")
-
-def style_function(feature):
-    area = extract_geojson_area(feature)
-    fill = "#dddddd"
-    if area in area_means:
-        fill = colormap(area_means[area])
-    if st.session_state.selected_area == area:
-        return {"fillColor": fill, "color": "red", "weight": 3, "fillOpacity": 0.65}
-    return {"fillColor": fill, "color": "#3333cc", "weight": 1, "fillOpacity": 0.55}
-
-def tooltip_content(feature):
-    props = feature.get("properties", {})
-    txt = []
-    for k in ["ElSpotOmr", "Elspot_omr", "ELSPOT_OMR"]:
-        if k in props:
-            txt.append(f"{k}: {props[k]}")
-    norm = extract_geojson_area(feature)
-    txt.append(f"Normalized: {norm}")
-    return "<br/>".join(txt)
+def handle_click(map_data):
+    last_click = (map_data or {}).get("last_clicked")
+    if not last_click or (last_click["lat"], last_click["lng"]) == st.session_state.get("handled_click"):
+        return
+    lat, lon = last_click["lat"], last_click["lng"]
+    st.session_state.handled_click = (lat, lon)
+    st.session_state.clicked_point = (lat, lon)
 
-for i, feat in enumerate(geojson_data.get("features", [])):
+    feature = area_index.feature_at(lat, lon)
+    st.session_state.selected_area = None if feature is None else geo_feature_area[feature]
+
+# The map's last return value is already in session state, so the highlight
+# can follow a click in the same rerun
+handle_click(st.session_state.get("price_map"))
+
+# ==============================================================================
+# Choropleth (cached per data type, group, year and level of detail)
+# ==============================================================================
+COLORS = ["#d73027", "#fee08b", "#1a9850"]  # red -> yellow -> green
+
+@cached("compute", st.cache_data(max_entries=64, show_spinner=False, ttl=3600))
+def choropleth_features(data_type, group, year, tolerance, area_mean_items):
+    """Area outlines with fill colour and tooltip fields stored on each feature.
+
+    ``area_mean_items`` is ``tuple(sorted(area_means.items()))``, so new
+    means after a sync or cube rebuild are a new cache entry. Areas come
+    from ``geo_feature_area``, so drawing the map never runs the area
+    normaliser again; only the selection changes between clicks and is
+    sent as a separate layer (see ``selection_layer``).
+    """
+    area_means = dict(area_mean_items)
+    vals = list(area_means.values())
+    colormap = branca.colormap.LinearColormap(colors=COLORS, vmin=min(vals), vmax=max(vals))
+
+    source = load_level(tolerance)["features"]
+    tooltip_keys = [k for k in ["ElSpotOmr", "Elspot_omr", "ELSPOT_OMR"]
+                    if all(k in feat.get("properties", {}) for feat in source)]
+    features = []
+    for i, feat in enumerate(source):
+        area = geo_feature_area[i]
+        fill = colormap(area_means[area]) if area in area_means else "#dddddd"
+        props = {k: feat["properties"][k] for k in tooltip_keys}
+        props.update(area=area, fill=fill)
+        features.append({"type": "Feature", "id": str(i), "geometry": feat["geometry"], "properties": props})
+    return {"type": "FeatureCollection", "features": features}, tooltip_keys, min(vals), max(vals)
+
+def draw_map(collection, tooltip_keys, vmin, vmax, group, year):
+    m = folium.Map(location=[63.0, 10.5], zoom_start=5.4, tiles="OpenStreetMap")
     folium.GeoJson(
-        feat,
-        style_function=style_function,
-        tooltip=folium.Tooltip(tooltip_content(feat), sticky=True)
+        collection,
+        style_function=lambda feature: {"fillColor": feature["properties"]["fill"], "color": "#3333cc",
+                                        "weight": 1, "fillOpacity": 0.55},
+        tooltip=folium.GeoJsonTooltip(fields=tooltip_keys + ["area"],
+                                      aliases=[f"{k}:" for k in tooltip_keys] + ["Normalized:"],
+                                      sticky=True),
     ).add_to(m)
-
-colormap.add_to(m)
-
-if st.session_state.clicked_point:
-    folium.Marker(
-        st.session_state.clicked_point,
-        icon=folium.Icon(color="red", icon="info-sign")
+    branca.colormap.LinearColormap(
+        colors=COLORS, vmin=vmin, vmax=vmax,
+        caption=f"Mean quantity kWh for {group} ({year})"
     ).add_to(m)
-
-# ==============================================================================
-# Click handler
-# ==============================================================================
-map_data = st_folium(m, width=1000, height=700)
-
-if map_data and map_data.get("last_clicked"):
-    lat = map_data["last_clicked"]["lat"]
-    lon = map_data["last_clicked"]["lng"]
-    st.session_state.clicked_point = (lat, lon)
-
-    point = Point(lon, lat)
-    clicked_area = None
-    for feat in geojson_data.get("features", []):
-        geom = shape(feat["geometry"])
-        if isinstance(geom, (Polygon, MultiPolygon)) and geom.contains(point):
-            clicked_area = extract_geojson_area(feat)
-            break
-
-    st.session_state.selected_area = clicked_area
+    return m
+
+def selection_layer(collection, selected_area, clicked_point):
+    """Red outline of the selected area and the click marker, sent without redrawing the map."""
+    fg = folium.FeatureGroup(name="selection")
+    if selected_area:
+        selected = [feat for feat in collection["features"] if feat["properties"]["area"] == selected_area]
+        folium.GeoJson(
+            {"type": "FeatureCollection", "features": selected},
+            style_function=lambda feature: {"color": "red", "weight": 3, "fillOpacity": 0.1},
+            interactive=False,
+        ).add_to(fg)
+    if clicked_point:
+        folium.Marker(clicked_point, icon=folium.Icon(color="red", icon="info-sign")).add_to(fg)
+    return fg
+
+view = st.session_state.map_view
+tolerance = tolerance_for_zoom(view["zoom"])
+collection, tooltip_keys, vmin, vmax = choropleth_features(
+    data_type, selected_group, selected_year, tolerance, tuple(sorted(area_means.items())))
+with span("render", "st_folium") as s:
+    m = draw_map(collection, tooltip_keys, vmin, vmax, selected_group, selected_year)
+    map_data = st_folium(
+        m,
+        key="price_map",
+        width=1000,
+        height=700,
+        center=view["center"],
+        zoom=view["zoom"],
+        feature_group_to_add=selection_layer(collection, st.session_state.selected_area,
+                                             st.session_state.clicked_point),
+    )
+    s.payload(collection)
+handle_click(map_data)
+
+# Remember the view so the next rerun draws the level of detail it needs
+if map_data and map_data.get("zoom"):
+    center = map_data.get("center") or {}
+    st.session_state.map_view = {
+        "center": [center.get("lat", view["center"][0]), center.get("lng", view["center"][1])],
+        "zoom": map_data["zoom"],
+    }
 
 # ==============================================================================
 # Display info
@@ -252,3 +229,5 @@ if st.session_state.selected_area:
     st.success(f"Selected area: **{st.session_state.selected_area}**")
 
 st.write(f"Clicked coordinates: {st.session_state.clicked_point}")
+
+render_timing_panel(trace)
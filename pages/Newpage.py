@@ -1,46 +1,39 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
-import certifi
 import plotly.express as px
+from utils.elhub import load_catalog
+from utils.mongo import get_database
+from utils.timing import cached, page_trace, render_timing_panel, span
 
 # -------------------------------
-# LOAD PRODUCTION DATA
+# LOAD PRODUCTION CATALOG
 # -------------------------------
-@st.cache_data(show_spinner="Loading production data...")
-def load_production_years():
-    client = MongoClient(st.secrets["mongo"]["uri"], tls=True, tlsCAFile=certifi.where())
-    db = client["Elhub"]
-    df = pd.DataFrame(list(db["Data"].find()))
-    
-    if df.empty:
-        return pd.DataFrame()  # empty fallback
+@cached("fetch", st.cache_data(show_spinner="Loading production catalog...", ttl=3600))
+def load_production_years(category):
+    """Available years, first/last timestamp and row count per category value.
 
-    # Convert starttime to datetime safely
-    df["starttime"] = pd.to_datetime(df["starttime"], errors="coerce", utc=True)
-    df = df.dropna(subset=["starttime"])
-
-    # Extract year
-    df["year"] = df["starttime"].dt.year
-
-    return df[["pricearea", "productiongroup", "year"]]
+    Read from the summary documents maintained in Elhub.catalog, so the cost
+    does not grow with the size of Elhub.Data.
+    """
+    return load_catalog(get_database("Elhub"), "Data", category)
 
 # -------------------------------
 # STREAMLIT APP
 # -------------------------------
+trace = page_trace("Newpage")
 st.title("Production Years from Elhub")
 
-prod_df = load_production_years()
+# Let user choose category
+category = st.selectbox("Select category", options=["pricearea", "productiongroup"])
+
+unique_years = load_production_years(category)
 
-if prod_df.empty:
+if unique_years.empty:
     st.warning("No production data found in MongoDB.")
 else:
-    # Let user choose category
-    category = st.selectbox("Select category", options=["pricearea", "productiongroup"])
-
     # Show unique years per category
-    unique_years = prod_df.groupby(category)["year"].unique().reset_index()
-    unique_years["year"] = unique_years["year"].apply(lambda x: sorted(list(x)))
-
     st.subheader(f"Unique Years for each {category.capitalize()}")
-    st.dataframe(unique_years)
+    with span("render", "dataframe") as s:
+        st.dataframe(s.payload(unique_years))
+
+render_timing_panel(trace)
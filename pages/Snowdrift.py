@@ -1,76 +1,17 @@
 import streamlit as st
 import folium
+from folium.plugins import HeatMap
 from streamlit_folium import st_folium
-import json
-from shapely.geometry import shape, Point
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-import requests_cache
+from utils.weather import load_era5_range
+from utils.snowdrift import SNOWDRIFT_COLUMNS, compute_yearly_results, compute_average_sector
+from utils.snowdrift_grid import load_grid, load_missing
+from utils.geo import get_area_index, load_price_areas
+from utils.timing import cached, page_trace, render_timing_panel, span
 
 # ------------------- Snow drift functions -------------------
-def compute_Qupot(hourly_wind_speeds, dt=3600):
-    total = sum((u ** 3.8) * dt for u in hourly_wind_speeds) / 233847
-    return total
-
-def sector_index(direction):
-    return int(((direction + 11.25) % 360) // 22.5)
-
-def compute_sector_transport(hourly_wind_speeds, hourly_wind_dirs, dt=3600):
-    sectors = [0.0] * 16
-    for u, d in zip(hourly_wind_speeds, hourly_wind_dirs):
-        idx = sector_index(d)
-        sectors[idx] += ((u ** 3.8) * dt) / 233847
-    return sectors
-
-def compute_snow_transport(T, F, theta, Swe, hourly_wind_speeds, dt=3600):
-    Qupot = compute_Qupot(hourly_wind_speeds, dt)
-    Qspot = 0.5 * T * Swe
-    Srwe = theta * Swe
-    if Qupot > Qspot:
-        Qinf = 0.5 * T * Srwe
-        control = "Snowfall controlled"
-    else:
-        Qinf = Qupot
-        control = "Wind controlled"
-    Qt = Qinf * (1 - 0.14 ** (F / T))
-    return {"Qupot": Qupot, "Qspot": Qspot, "Srwe": Srwe, "Qinf": Qinf, "Qt": Qt, "Control": control}
-
-def compute_yearly_results(df, T, F, theta):
-    seasons = sorted(df['season'].unique())
-    results_list = []
-    for s in seasons:
-        # Make timestamps UTC-aware
-        season_start = pd.Timestamp(year=s, month=7, day=1, tz='UTC')
-        season_end = pd.Timestamp(year=s+1, month=6, day=30, hour=23, minute=59, second=59, tz='UTC')
-        
-        df_season = df[(df.index >= season_start) & (df.index <= season_end)].copy()
-        if df_season.empty:
-            continue
-        df_season.loc[:, 'Swe_hourly'] = df_season.apply(
-            lambda row: row['precipitation'] if row['temperature_2m'] < 1 else 0, axis=1
-        )
-        total_Swe = df_season['Swe_hourly'].sum()
-        wind_speeds = df_season["wind_speed_10m"].tolist()
-        result = compute_snow_transport(T, F, theta, total_Swe, wind_speeds)
-        result["season"] = f"{s}-{s+1}"
-        results_list.append(result)
-    return pd.DataFrame(results_list)
-
-def compute_average_sector(df):
-    sectors_list = []
-    for s, group in df.groupby('season'):
-        group = group.copy()
-        group.loc[:, 'Swe_hourly'] = group.apply(
-            lambda row: row['precipitation'] if row['temperature_2m'] < 1 else 0, axis=1
-        )
-        ws = group["wind_speed_10m"].tolist()
-        wdir = group["wind_direction_10m"].tolist()
-        sectors = compute_sector_transport(ws, wdir)
-        sectors_list.append(sectors)
-    avg_sectors = np.mean(sectors_list, axis=0)
-    return avg_sectors
-
 def plot_wind_rose(avg_sector_values, overall_avg):
     directions = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
                   'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
@@ -93,81 +34,112 @@ def plot_wind_rose(avg_sector_values, overall_avg):
             angularaxis=dict(direction="clockwise", rotation=90, tickmode='array', tickvals=theta, ticktext=directions)
         )
     )
-    st.plotly_chart(fig)
-
-# ------------------- Open-Meteo ERA5 downloader with caching -------------------
-# Requests-cache session
-session = requests_cache.CachedSession(".cache", expire_after=86400)  # cache for 1 day
-
-@st.cache_data(show_spinner="Downloading weather data...")
-def download_era5_openmeteo(lat, lon, year, timezone="Europe/Oslo"):
-    """
-    Downloads weather data from Open-Meteo or fetches from requests_cache if available.
-    Returns a dataframe with UTC-aware datetime index.
-    """
-    url = "https://archive-api.open-meteo.com/v1/archive"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "start_date": f"{year}-01-01",
-        "end_date": f"{year}-12-31",
-        "hourly": ["temperature_2m", "precipitation", "wind_speed_10m",
-                   "wind_gusts_10m", "wind_direction_10m"],
-        "models": "era5",
-        "timezone": timezone,
-    }
-    response = session.get(url, params=params)
-    response.raise_for_status()
-    data = response.json()
-    df = pd.DataFrame(data['hourly'])
-    df['time'] = pd.to_datetime(df['time'], utc=True)
-    df = df.set_index('time')
-    df['season'] = df.index.to_series().apply(lambda dt: dt.year if dt.month >= 7 else dt.year - 1)
-    return df
+    with span("render", "wind_rose") as s:
+        st.plotly_chart(s.payload(fig))
+
+@cached("fetch", st.cache_data(ttl=3600))
+def load_grid_table():
+    """Precomputed Qt per grid cell and season (``python -m utils.snowdrift_grid``)."""
+    return load_grid()
+
+@cached("fetch", st.cache_data(ttl=3600))
+def load_missing_cells():
+    """Grid cells the last batch run could not compute (download failed or quota spent)."""
+    return load_missing()
 
 # ------------------- Streamlit App -------------------
 st.title("Snow Drift Analysis with Map & Open-Meteo Data")
+trace = page_trace("Snowdrift")
 
-# --- Load GeoJSON ---
-geojson_path = "file.geojson"
-with open(geojson_path, "r", encoding="utf-8") as f:
-    geojson_data = json.load(f)
+# --- Load GeoJSON (parsed and indexed once per process) ---
+with span("parse", "area_index"):
+    area_index = get_area_index("file.geojson")
 
 if "clicked_point" not in st.session_state:
     st.session_state.clicked_point = None
 if "selected_area" not in st.session_state:
     st.session_state.selected_area = None
+if "snowdrift_view" not in st.session_state:
+    st.session_state.snowdrift_view = {"center": [63.0, 10.5], "zoom": 5.2}
 
 # --- Folium map ---
-m = folium.Map(location=[63.0, 10.5], zoom_start=5.2)
+view = st.session_state.snowdrift_view
+m = folium.Map(location=view["center"], zoom_start=view["zoom"])
 def style_function(feature):
     if st.session_state.selected_area == feature["properties"]["ElSpotOmr"]:
         return {"fillColor":"red","color":"red","weight":3,"fillOpacity":0.6}
     else:
         return {"fillColor":"blue","color":"blue","weight":1,"fillOpacity":0.3}
 
+with span("fetch", "load_price_areas") as s:
+    outlines = s.payload(load_price_areas(view["zoom"]))  # simplified for the current zoom
 folium.GeoJson(
-    geojson_data,
+    outlines,
     style_function=style_function,
     tooltip=folium.GeoJsonTooltip(fields=["ElSpotOmr"], aliases=["Area:"])
 ).add_to(m)
 
+# --- Precomputed snow drift heat map ---
+grid = load_grid_table()
+if grid is None:
+    st.caption("No precomputed snow drift grid yet; run `python -m utils.snowdrift_grid --from 2020 --to 2022`.")
+elif st.checkbox("Show snow drift heat map for all of Norway", value=True):
+    seasons = sorted(grid["season"].astype(str).unique())
+    grid_season = st.selectbox("Heat map season", ["Mean over seasons"] + seasons)
+    with span("compute", "heat_map_cells"):
+        if grid_season == "Mean over seasons":
+            cells = grid.groupby(["lat", "lon"], as_index=False)["Qt"].mean()
+        else:
+            cells = grid[grid["season"] == grid_season]
+        cells = cells.dropna(subset=["Qt"])
+    # Weights relative to the largest cell, so colours are comparable across seasons
+    weight = cells["Qt"] / (cells["Qt"].max() or 1.0)
+    HeatMap(
+        list(zip(cells["lat"], cells["lon"], weight)),
+        name="Snow drift (Qt)",
+        min_opacity=0.3,
+        radius=25,
+        blur=20,
+    ).add_to(m)
+    missing = load_missing_cells()
+    if len(missing):
+        total = len(missing) + grid.groupby(["lat", "lon"]).ngroups
+        st.warning(f"{len(missing)} of {total} grid cells have no data yet (marked grey on the map); "
+                   "the heat map covers the rest. Rerun `python -m utils.snowdrift_grid` to fill them in.")
+        for lat, lon, reason in zip(missing["lat"], missing["lon"], missing["reason"]):
+            folium.CircleMarker([lat, lon], radius=3, color="grey", fill=True, tooltip=reason).add_to(m)
+        with st.expander("Missing grid cells"):
+            st.dataframe(missing)
+    with st.expander("Grid summary per price area"):
+        part = grid if grid_season == "Mean over seasons" else grid[grid["season"] == grid_season]
+        summary = part.groupby("area", observed=True).agg(
+            cells=("Qt", "size"),
+            mean_Qt=("Qt", "mean"),
+            max_Qt=("Qt", "max"),
+            control=("Control", lambda c: c.mode().iat[0]),
+            sector=("sector", lambda c: c.mode().iat[0]),
+        )
+        summary[["mean_Qt", "max_Qt"]] /= 1000
+        st.dataframe(summary.rename(columns={"mean_Qt": "mean Qt (tonnes/m)", "max_Qt": "max Qt (tonnes/m)"}))
+
 if st.session_state.clicked_point:
     folium.Marker(st.session_state.clicked_point, icon=folium.Icon(color="red")).add_to(m)
 
-map_data = st_folium(m, width=900, height=500)
+with span("render", "st_folium"):
+    map_data = st_folium(m, key="snowdrift_map", width=900, height=500)
+if map_data and map_data.get("zoom"):
+    center = map_data.get("center") or {}
+    st.session_state.snowdrift_view = {
+        "center": [center.get("lat", view["center"][0]), center.get("lng", view["center"][1])],
+        "zoom": map_data["zoom"],
+    }
 
 # --- Handle clicks ---
-if map_data and map_data.get("last_clicked"):
-    st.session_state.clicked_point = (map_data["last_clicked"]["lat"], map_data["last_clicked"]["lng"])
-    p = Point(st.session_state.clicked_point[1], st.session_state.clicked_point[0])
-    clicked_area = None
-    for feature in geojson_data["features"]:
-        polygon = shape(feature["geometry"])
-        if polygon.contains(p):
-            clicked_area = feature["properties"]["ElSpotOmr"]
-            break
-    st.session_state.selected_area = clicked_area
+# The map's last value is kept under its key by st_folium (as on the Map page)
+last_click = (st.session_state.get("snowdrift_map") or {}).get("last_clicked")
+if last_click:
+    st.session_state.clicked_point = (last_click["lat"], last_click["lng"])
+    st.session_state.selected_area = area_index.property_at(*st.session_state.clicked_point, "ElSpotOmr")
 
 # --- Snow drift calculation ---
 if st.session_state.selected_area and st.session_state.clicked_point:
@@ -181,14 +153,13 @@ if st.session_state.selected_area and st.session_state.clicked_point:
     F = 30000
     theta = 0.5
 
-    # Download with caching
-    all_years_df = []
-    for year in range(start_year, end_year + 1):
-        df_year = download_era5_openmeteo(lat, lon, year)
-        all_years_df.append(df_year)
-    df_all = pd.concat(all_years_df)
+    # One contiguous July–June range; only spans missing from the local store are downloaded
+    with st.spinner("Loading weather data..."), span("fetch", "load_era5_range") as s:
+        df_all = s.payload(load_era5_range(lat, lon, f"{start_year}-07-01", f"{end_year + 1}-06-30",
+                                           columns=SNOWDRIFT_COLUMNS))
 
-    yearly_df = compute_yearly_results(df_all, T, F, theta)
+    with span("compute", "compute_yearly_results"):
+        yearly_df = compute_yearly_results(df_all, T, F, theta)
     if yearly_df.empty:
         st.warning("No snow drift data available for the selected range.")
     else:
@@ -199,13 +170,17 @@ if st.session_state.selected_area and st.session_state.clicked_point:
         # Qt bar chart
         fig_bar = go.Figure([go.Bar(x=yearly_df['season'], y=yearly_df['Qt (tonnes/m)'], marker_color='skyblue')])
         fig_bar.update_layout(title="Yearly Snow Drift", yaxis_title="Qt (tonnes/m)")
-        st.plotly_chart(fig_bar)
+        with span("render", "yearly_bar_chart") as s:
+            st.plotly_chart(s.payload(fig_bar))
 
         # Wind rose
-        avg_sectors = compute_average_sector(df_all)
+        with span("compute", "compute_average_sector"):
+            avg_sectors = compute_average_sector(df_all)
         overall_avg = yearly_df['Qt'].mean()
         st.subheader("Wind Rose of Snow Transport")
         plot_wind_rose(avg_sectors, overall_avg)
 else:
     st.info("Click on the map to select a location.")
 
+render_timing_panel(trace)
+
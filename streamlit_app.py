@@ -1,4 +1,23 @@
+import os
+import pandas as pd
 import streamlit as st
+from utils import mongo
+from utils.prefetch import start_background_warmup
+
+# Warm the local ERA5 store for all five cities once per server process,
+# and again every night, so first selections on the weather pages read from disk.
+@st.cache_resource
+def era5_warmup():
+    first_year = int(os.environ.get("ERA5_WARMUP_FROM", 2021))
+    years = range(first_year, pd.Timestamp.now().year + 1)
+    return start_background_warmup(years, interval=24 * 3600)
+
+if os.environ.get("ERA5_WARMUP", "1") != "0":
+    warmup = era5_warmup()["report"].summary()
+    st.sidebar.caption(
+        f"Weather cache warm-up: {warmup['done']}/{warmup['total']} "
+        f"(p95 {warmup['p95_s']:.1f}s, {warmup['failed']} failed)"
+    )
 
 st.title("⚡ Energy & Weather Dashboard")
 st.markdown("""
@@ -37,6 +56,16 @@ st.image(
     use_container_width=True
 )
 
+# MongoDB connection pool health (shared by every page and session)
+with st.sidebar.expander("MongoDB pool"):
+    if st.checkbox("Check connection", value=False):
+        ok, latency_ms, error = mongo.ping()
+        if ok:
+            st.success(f"Ping {latency_ms:.0f} ms")
+        else:
+            st.error(error)
+        st.json(mongo.metrics.snapshot())
+
 st.markdown("---")
 st.info("Use the sidebar to navigate between different pages of the dashboard :)")
 
@@ -0,0 +1 @@
+"""Shared data-access and analysis helpers used by the Streamlit pages."""
@@ -0,0 +1,215 @@
+"""
+Nightly precomputation of every dashboard view.
+
+    python -m utils.batch                          # default jobs, 2021 .. this year
+    python -m utils.batch --years 2021 2024 --only era5 analyses --workers 8
+    python -m utils.batch --only grid              # opt-in: the snow drift grid
+
+Jobs, in dependency order:
+
+    era5       fill the ERA5 store for every price-area city and year
+               (rate-limited thread pool, see ``utils.prefetch``)
+    elhub      ensure the Elhub indexes, sync the snapshots, build/store the
+               rollup cubes the Elhub and Map pages read (see
+               ``utils.elhub_cube``) and refresh the catalog behind Newpage
+    stl        STL decompositions of every price area × group series at the
+               common periods (process pool, see ``utils.stl``)
+    grid       download and compute the snow drift grid for the seasons
+               covered by ``--years`` (see ``utils.snowdrift_grid``). Not
+               part of the default run: a full grid needs more than one
+               day of the Open-Meteo quota, so it is requested with
+               ``--only grid`` and stops at the daily budget it shares
+               with ``era5`` (cells it could not fetch are recorded)
+    analyses   per city on a process pool, from the ERA5 store: temperature
+               SPC and precipitation LOF outliers for every year, and snow
+               drift Qt and sector transport for every July–June season.
+               Written to the result store:
+
+                   .results_store/outliers.parquet
+                   .results_store/snowdrift_seasons.parquet
+
+A failing job is logged and reported; the remaining jobs still run.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from utils.weather import load_era5_range, price_areas
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = Path(os.environ.get("RESULTS_STORE", ".results_store"))
+JOBS = ["era5", "elhub", "stl", "grid", "analyses"]
+DEFAULT_JOBS = [job for job in JOBS if job != "grid"]
+
+
+# ======================================================
+# Result store
+# ======================================================
+def result_path(name):
+    return STORE_DIR / f"{name}.parquet"
+
+
+def write_result(name, df):
+    path = result_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def load_result(name):
+    """A stored result table, or ``None`` before the first batch run."""
+    path = result_path(name)
+    return pd.read_parquet(path) if path.exists() else None
+
+
+# ======================================================
+# Per-city analyses (worker processes)
+# ======================================================
+def city_analyses(city, years, timezone="Europe/Oslo"):
+    """Outlier and snow drift tables of one city from the ERA5 store (no downloads)."""
+    from utils.outliers import detect_precipitation_outliers, detect_temperature_outliers, outlier_table
+    from utils.snowdrift import SNOWDRIFT_COLUMNS, compute_season_sectors, compute_yearly_results
+    from utils.snowdrift_grid import DIRECTIONS, F, T, THETA
+
+    years = list(years)
+    df = load_era5_range(city["latitude"], city["longitude"], f"{years[0]}-01-01", f"{years[-1]}-12-31",
+                         timezone, fetch=False, columns=SNOWDRIFT_COLUMNS)
+    if df.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    by_year = {y: part for y, part in df.groupby(df.index.year)}
+    outliers = []
+    fits = detect_temperature_outliers({y: part["temperature_2m"] for y, part in by_year.items()})
+    for year, fit in fits.items():
+        hits = outlier_table(fit).rename(columns={"temperature": "value"})
+        outliers.append(hits.assign(kind="temperature", year=year))
+    for year, part in by_year.items():
+        hits = detect_precipitation_outliers(part["precipitation"], 0.01)
+        outliers.append(hits.rename(columns={"precipitation": "value"}).assign(kind="precipitation", year=year))
+    outliers = pd.concat(outliers).rename_axis("time").reset_index()
+    outliers["time"] = outliers["time"].dt.tz_convert("UTC")
+
+    # Complete July–June seasons only
+    season_df = df[(df["season"] >= years[0]) & (df["season"] < years[-1])]
+    seasons = compute_yearly_results(season_df, T, F, THETA)
+    _, sectors = compute_season_sectors(season_df)
+    seasons[DIRECTIONS] = sectors
+
+    columns = {"city": city["city"], "price_area": city["price_area"]}
+    return outliers.assign(**columns), seasons.assign(**columns)
+
+
+def _city_job(args):
+    return city_analyses(*args)
+
+
+def run_analyses(years, cities=price_areas, max_workers=None, timezone="Europe/Oslo"):
+    """``city_analyses`` for every city on a process pool; writes both result tables."""
+    jobs = [(c, years, timezone) for c in cities]
+    with ProcessPoolExecutor(max_workers=max_workers or min(len(jobs), os.cpu_count())) as pool:
+        results = list(pool.map(_city_job, jobs))
+    outliers = pd.concat([o for o, _ in results], ignore_index=True)
+    seasons = pd.concat([s for _, s in results], ignore_index=True)
+    write_result("outliers", outliers)
+    write_result("snowdrift_seasons", seasons)
+    return {"outliers": len(outliers), "seasons": len(seasons)}
+
+
+# ======================================================
+# Jobs
+# ======================================================
+def run_era5(years, max_workers=4):
+    from utils.prefetch import city_year_jobs, prefetch
+    report = prefetch(city_year_jobs(years), max_workers=max_workers)
+    summary = report.summary()
+    if summary["failed"]:
+        raise RuntimeError(f"{summary['failed']} of {summary['total']} city-years failed: {report.errors[:3]}")
+    return summary
+
+
+def run_elhub():
+    from utils.elhub import CONSUMPTION, PRODUCTION, ensure_indexes, refresh_catalog
+    from utils.elhub_cube import get_cube
+    from utils.elhub_sync import sync_dataset
+    from utils.mongo import get_database
+
+    for dataset in (PRODUCTION, CONSUMPTION):
+        database, collection, group_field = dataset
+        ensure_indexes(get_database(database)[collection], group_field)
+        sync_dataset(dataset)
+    # Summary documents behind Newpage, so sessions rarely have to rebuild them
+    database, collection, group_field = PRODUCTION
+    refresh_catalog(get_database(database), collection, categories=("pricearea", group_field))
+    # The (dataset, dedupe) combinations the Elhub and Map pages ask for
+    built = {}
+    for dataset, dedupe in [(PRODUCTION, "first"), (PRODUCTION, "sum"), (CONSUMPTION, "sum")]:
+        built[f"{dataset[0]}/{dedupe}"] = len(get_cube(dataset, dedupe, refresh=False).cube)
+    return built
+
+
+def run_stl(max_workers=None):
+    from utils.elhub import EXAMPLE
+    from utils.mongo import get_database
+    from utils.stl import COMMON_PERIODS, all_series, decompose_many
+
+    database, collection, _ = EXAMPLE
+    named = all_series(get_database(database)[collection])
+    done = decompose_many(named, max_workers=max_workers)
+    return {"computed": len(done), "stored": len(named) * len(COMMON_PERIODS) - len(done)}
+
+
+def run_grid(years, max_workers=None):
+    from utils.snowdrift_grid import compute_grid
+    start, end = years[0], max(years[0], years[-1] - 1)
+    table = compute_grid(start, end, max_workers=max_workers)
+    return {"rows": len(table), "seasons": f"{start}-{end + 1}"}
+
+
+def run_all(years, only=DEFAULT_JOBS, max_workers=None):
+    """Run the selected jobs in order; returns ``{job: (seconds, result or error)}``."""
+    years = list(years)
+    steps = {
+        "era5": lambda: run_era5(years),
+        "elhub": run_elhub,
+        "stl": lambda: run_stl(max_workers),
+        "grid": lambda: run_grid(years, max_workers),
+        "analyses": lambda: run_analyses(years, max_workers=max_workers),
+    }
+    report = {}
+    for job in JOBS:
+        if job not in only:
+            continue
+        t0 = time.perf_counter()
+        try:
+            result = steps[job]()
+            logger.info("%s done in %.1fs: %s", job, time.perf_counter() - t0, result)
+        except Exception as e:  # one failing source must not stop the other precomputations
+            logger.exception("%s failed", job)
+            result = e
+        report[job] = (time.perf_counter() - t0, result)
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Precompute every dashboard view into the local stores.")
+    parser.add_argument("--years", type=int, nargs=2, metavar=("FIRST", "LAST"),
+                        default=[int(os.environ.get("ERA5_WARMUP_FROM", 2021)), pd.Timestamp.now().year])
+    parser.add_argument("--only", nargs="+", choices=JOBS, default=DEFAULT_JOBS,
+                        help="jobs to run (default: all but grid)")
+    parser.add_argument("--workers", type=int, default=None, help="compute processes")
+    a = parser.parse_args()
+
+    report = run_all(range(a.years[0], a.years[1] + 1), a.only, a.workers)
+    for job, (seconds, result) in report.items():
+        status = "FAILED" if isinstance(result, Exception) else "ok"
+        print(f"{job:9s} {status:6s} {seconds:7.1f}s  {result}")
+    raise SystemExit(any(isinstance(r, Exception) for _, r in report.values()))
@@ -0,0 +1,118 @@
+"""
+Downsampling of time series before they are sent to the browser.
+
+A chart cannot show more distinct points than it has pixel columns, so the
+pages reduce each line to about ``target_points(width)`` points first:
+
+    lttb     Largest-Triangle-Three-Buckets, one point per pixel column,
+             chosen to preserve the visual shape of the line.
+    minmax   The minimum and maximum of every pixel column (two points per
+             column), so no peak or trough is ever lost.
+
+Rows flagged in ``keep`` (outliers, anomalies) and rows with a missing value
+(gaps the chart should show) are always kept.
+"""
+import numpy as np
+import pandas as pd
+
+# Width (px) the pages lay their time-series charts out at
+CHART_WIDTH = 900
+
+
+def target_points(width=CHART_WIDTH, method="lttb"):
+    """Points worth sending for a chart ``width`` pixels wide."""
+    return int(width) * (2 if method == "minmax" else 1)
+
+
+def _numeric(values):
+    """Float positions for numeric or datetime-like x values."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.DatetimeIndex(values).asi8.astype(np.float64)
+    return np.asarray(values, dtype=np.float64)
+
+
+# ======================================================
+# Index selection
+# ======================================================
+def lttb_indices(x, y, n_out):
+    """Positions of the ``n_out`` points LTTB keeps from sorted ``(x, y)``."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # First and last point are fixed; the rest are split into n_out - 2 buckets
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.intp) + 1
+    edges[-1] = n - 1
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.r_[sums_x / counts, x[n - 1]]
+    avg_y = np.r_[sums_y / counts, y[n - 1]]
+
+    out = np.empty(n_out, dtype=np.intp)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Triangle between the previous pick, each candidate and the next bucket's average
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y, n_out):
+    """Positions of the minimum and maximum of ``n_out // 2`` equal buckets (plus both ends), in order."""
+    n = len(y)
+    n_buckets = n_out // 2
+    if n_buckets < 1 or n_out >= n:
+        return np.arange(n)
+
+    edges = (np.arange(n_buckets) * n / n_buckets).astype(np.intp)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(np.r_[edges, n]))
+    lo = np.minimum.reduceat(y, edges)[bucket] == y
+    hi = np.maximum.reduceat(y, edges)[bucket] == y
+    # First position of each bucket's minimum and maximum
+    _, first_lo = np.unique(bucket[lo], return_index=True)
+    _, first_hi = np.unique(bucket[hi], return_index=True)
+    picks = np.r_[0, np.flatnonzero(lo)[first_lo], np.flatnonzero(hi)[first_hi], n - 1]
+    return np.unique(picks)
+
+
+# ======================================================
+# Frames
+# ======================================================
+def _select(x, y, n_out, method):
+    if method == "minmax":
+        return minmax_indices(y, n_out)
+    return lttb_indices(x, y, n_out)
+
+
+def _kept_positions(xs, ys, groups, keep, n_out, method):
+    kept = np.zeros(len(ys), dtype=bool) if keep is None else np.asarray(keep, dtype=bool).copy()
+    kept |= ~np.isfinite(ys)
+    for positions in groups:
+        positions = positions[np.isfinite(ys[positions])]
+        positions = positions[np.argsort(xs[positions], kind="stable")]
+        kept[positions[_select(xs[positions], ys[positions], n_out, method)]] = True
+    return np.flatnonzero(kept)
+
+
+def downsample(data, x=None, y=None, by=None, keep=None, n_out=None,
+               width=CHART_WIDTH, method="lttb"):
+    """Rows of ``data`` worth plotting, in their original order.
+
+    ``data`` is a DataFrame with columns ``x`` (default: the index) and
+    ``y``, or a Series indexed by x. With ``by`` each group (one line of a
+    multi-line chart) is reduced on its own. ``keep`` is a boolean mask of
+    rows that must survive (e.g. outliers drawn as markers).
+    """
+    n_out = n_out or target_points(width, method)
+    if isinstance(data, pd.Series):
+        xs, ys = _numeric(data.index), data.to_numpy(dtype=np.float64)
+    else:
+        xs = _numeric(data.index if x is None else data[x])
+        ys = data[y].to_numpy(dtype=np.float64)
+    groups = [np.arange(len(data))] if by is None else data.groupby(by, sort=False).indices.values()
+    return data.iloc[_kept_positions(xs, ys, groups, keep, n_out, method)]
@@ -0,0 +1,335 @@
+"""
+Elhub query layer.
+
+Builds MongoDB aggregation pipelines from a page's selection so that the
+filtering, de-duplication and grouping run inside MongoDB and only
+result-sized data crosses the wire:
+
+    $match (area / group)  ->  $project (needed fields)  ->  $match (time)
+    ->  $group (one value per area, group, hour)  ->  $group (requested keys)
+
+Every pipeline only uses standard operators, so it runs unchanged against
+Atlas or a local ``mongod``. (``mongomock`` lacks ``$convert``; seed it with
+BSON dates and drop that expression when using it as a stand-in.)
+"""
+import logging
+import re
+
+import pandas as pd
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# (database, collection, group field) of the Elhub datasets
+PRODUCTION = ("Elhub", "Data", "productiongroup")
+CONSUMPTION = ("Consumption_Elhub", "Data", "consumptiongroup")
+EXAMPLE = ("example", "data", "productiongroup")
+
+REDUCERS = {"sum": "$sum", "mean": "$avg", "min": "$min", "max": "$max", "count": "$sum"}
+
+
+# ======================================================
+# Pipeline stages
+# ======================================================
+def match_stage(group_field, areas=None, groups=None):
+    """``$match`` on price area and group, placed first so indexes can be used."""
+    query = {}
+    if areas is not None:
+        query["pricearea"] = {"$in": list(areas)}
+    if groups is not None:
+        query[group_field] = {"$in": list(groups)}
+    return {"$match": query}
+
+
+def project_stage(group_field):
+    """Keep only the fields the aggregation needs; ``starttime`` becomes a date.
+
+    Elhub rows are stored with either BSON dates or ISO strings, so the
+    value is converted instead of trusted.
+    """
+    return {"$project": {
+        "_id": 0,
+        "pricearea": 1,
+        group_field: 1,
+        "quantitykwh": 1,
+        "starttime": {"$convert": {"input": "$starttime", "to": "date", "onError": None, "onNull": None}},
+    }}
+
+
+def _as_bson_date(ts):
+    """Naive UTC ``datetime`` as MongoDB stores dates; naive input is taken as UTC."""
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts.to_pydatetime()
+
+
+def time_stage(start=None, end=None, year=None, month=None):
+    """``$match`` on [start, end) and/or calendar year and month (UTC)."""
+    query = {"starttime": {"$ne": None}}
+    if start is not None:
+        query["starttime"]["$gte"] = _as_bson_date(start)
+    if end is not None:
+        query["starttime"]["$lt"] = _as_bson_date(end)
+    conditions = []
+    if year is not None:
+        conditions.append({"$eq": [{"$year": "$starttime"}, int(year)]})
+    if month is not None:
+        conditions.append({"$eq": [{"$month": "$starttime"}, int(month)]})
+    if conditions:
+        query["$expr"] = {"$and": conditions}
+    return {"$match": query}
+
+
+def collapse_stage(group_field, dedupe="sum"):
+    """One value per (pricearea, group, starttime).
+
+    ``dedupe="sum"`` adds up repeated rows (Map, STL pages); ``"first"``
+    keeps the first one, like ``drop_duplicates(keep="first")``.
+    """
+    op = "$sum" if dedupe == "sum" else "$first"
+    return {"$group": {
+        "_id": {"pricearea": "$pricearea", "group": f"${group_field}", "starttime": "$starttime"},
+        "quantitykwh": {op: "$quantitykwh"},
+    }}
+
+
+def rollup_stages(group_field, by, reducer="sum"):
+    """``$group`` the collapsed rows by ``by`` and flatten the result."""
+    source = {"pricearea": "$_id.pricearea", group_field: "$_id.group", "starttime": "$_id.starttime"}
+    key = {k: source[k] for k in by}
+    value = 1 if reducer == "count" else "$quantitykwh"
+    flat = {"_id": 0, "quantitykwh": 1}
+    flat.update({k: f"$_id.{k}" for k in by})
+    return [
+        {"$group": {"_id": key, "quantitykwh": {REDUCERS[reducer]: value}}},
+        {"$project": flat},
+        {"$sort": {k: 1 for k in by}},
+    ]
+
+
+def build_pipeline(group_field, by, reducer="sum", dedupe="sum", areas=None, groups=None,
+                   start=None, end=None, year=None, month=None):
+    """Full pipeline for one page selection; see the module docstring."""
+    return [
+        match_stage(group_field, areas, groups),
+        project_stage(group_field),
+        time_stage(start, end, year, month),
+        collapse_stage(group_field, dedupe),
+        *rollup_stages(group_field, by, reducer),
+    ]
+
+
+# ======================================================
+# Price-area codes
+# ======================================================
+def normalize_to_NO(code):
+    """``"NO1"`` .. ``"NO9"`` for the spellings found in Elhub and GeoJSON data, else None."""
+    if code is None:
+        return None
+    if isinstance(code, int):
+        return f"NO{code}"
+    s = str(code).strip().upper()
+    s = re.sub(r"[^A-Z0-9]", "", s)
+    m = re.match(r"^N0?([1-9])$", s)
+    if m:
+        return f"NO{m.group(1)}"
+    m2 = re.match(r"^NO0?([1-9])$", s)
+    if m2:
+        return f"NO{m2.group(1)}"
+    m3 = re.match(r"^0?([1-9])$", s)
+    if m3:
+        return f"NO{m3.group(1)}"
+    return None
+
+
+def canonical_areas(areas):
+    """A categorical ``pricearea`` column with every recognised code spelled ``NOx``.
+
+    Unrecognised codes are kept as they are. Mapping the categories, not the
+    rows, keeps this cheap on the hourly data.
+    """
+    areas = areas.astype("category")
+    mapping = {c: normalize_to_NO(c) or c for c in areas.cat.categories}
+    return areas.map(mapping).astype("category")
+
+
+# ======================================================
+# Compact schema
+# ======================================================
+def compact_frame(df, group_field):
+    """Canonical in-memory layout of an Elhub frame.
+
+    Only ``pricearea``, the group field, ``starttime`` and ``quantitykwh``
+    are kept (``_id``, ``endtime``, ``lastupdatedtime`` ... are dropped).
+    Area and group become dictionary-encoded categoricals, ``starttime``
+    a UTC datetime64 column and ``quantitykwh`` float32: about 14 bytes per
+    row instead of ~150 (see ``benchmarks/elhub_memory.py``).
+    """
+    columns = [c for c in ("pricearea", group_field, "starttime", "quantitykwh") if c in df.columns]
+    out = df[columns].copy()
+    for col in ("pricearea", group_field):
+        if col in out.columns:
+            out[col] = out[col].astype("category")
+    if "starttime" in out.columns and not isinstance(out["starttime"].dtype, pd.DatetimeTZDtype):
+        out["starttime"] = pd.to_datetime(out["starttime"], errors="coerce", utc=True)
+    if "quantitykwh" in out.columns:
+        out["quantitykwh"] = out["quantitykwh"].astype("float32")
+    return out
+
+
+# ======================================================
+# Queries
+# ======================================================
+def aggregate(collection, group_field, by, reducer="sum", dedupe="sum", **selection):
+    """Run ``build_pipeline`` and return the result as a DataFrame.
+
+    ``by`` is any subset of ``("pricearea", group_field, "starttime")``;
+    ``selection`` takes the ``areas``/``groups``/``start``/``end``/``year``/
+    ``month`` filters of ``build_pipeline``.
+    """
+    by = list(by)
+    pipeline = build_pipeline(group_field, by, reducer, dedupe, **selection)
+    df = pd.DataFrame(list(collection.aggregate(pipeline, allowDiskUse=True)),
+                      columns=by + ["quantitykwh"])
+    return compact_frame(df, group_field)
+
+
+def distinct_values(collection, field):
+    """Sorted distinct non-null values of one field (served from an index when present)."""
+    return sorted(v for v in collection.distinct(field) if v is not None)
+
+
+# ======================================================
+# Catalog (available years, first/last timestamps, row counts)
+# ======================================================
+CATALOG_COLLECTION = "catalog"
+
+
+def catalog_pipeline(category):
+    """Per value of ``category``: sorted years, first/last ``starttime`` and row count."""
+    return [
+        {"$project": {
+            "_id": 0,
+            "value": f"${category}",
+            "starttime": {"$convert": {"input": "$starttime", "to": "date", "onError": None, "onNull": None}},
+        }},
+        {"$match": {"starttime": {"$ne": None}}},
+        {"$group": {
+            "_id": {"value": "$value", "year": {"$year": "$starttime"}},
+            "first": {"$min": "$starttime"},
+            "last": {"$max": "$starttime"},
+            "rows": {"$sum": 1},
+        }},
+        {"$sort": {"_id.year": 1}},
+        {"$group": {
+            "_id": "$_id.value",
+            "years": {"$push": "$_id.year"},
+            "first": {"$min": "$first"},
+            "last": {"$max": "$last"},
+            "rows": {"$sum": "$rows"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def ensure_indexes(collection, group_field):
+    """Compound index backing the ``$match`` stages and ``distinct`` lookups.
+
+    Needs write access; read-only users keep the existing indexes (logged).
+    """
+    try:
+        collection.create_index([("pricearea", 1), (group_field, 1), ("starttime", 1)])
+        collection.create_index([(group_field, 1)])
+    except PyMongoError as e:
+        logger.warning("Could not create the indexes of %s: %s", collection.full_name, e)
+
+
+# Index with the same key but other options (85, 86), or duplicated keys (11000)
+CATALOG_KEY_CONFLICTS = {85, 86, 11000}
+
+
+def _drop_duplicate_summaries(summaries):
+    """Keep one document per (collection, category, value); returns how many were removed."""
+    groups = summaries.aggregate([
+        {"$group": {"_id": {"collection": "$collection", "category": "$category", "value": "$value"},
+                    "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ])
+    extra = [i for g in groups for i in g["ids"][1:]]
+    return summaries.delete_many({"_id": {"$in": extra}}).deleted_count if extra else 0
+
+
+def _ensure_catalog_key(summaries):
+    keys = [("collection", 1), ("category", 1), ("value", 1)]
+    try:
+        summaries.create_index(keys, unique=True)
+    except OperationFailure as e:
+        if e.code not in CATALOG_KEY_CONFLICTS:
+            raise
+        # Catalogs from before the key was unique: the old index and the
+        # duplicated summaries go, every other document stays
+        if e.code != 11000:
+            summaries.drop_index(keys)
+        removed = _drop_duplicate_summaries(summaries)
+        logger.info("Catalog key made unique; %d duplicated summaries removed", removed)
+        summaries.create_index(keys, unique=True)
+
+
+def refresh_catalog(database, collection_name, categories=("pricearea", "productiongroup")):
+    """Rebuild the summary documents of one collection in ``<database>.catalog``.
+
+    One full aggregation per category; the nightly ``python -m utils.batch``
+    runs it after syncing. Each summary is upserted under a unique
+    (collection, category, value) key and values that disappeared are
+    removed, so concurrent refreshes cannot leave duplicates. Needs write
+    access (raises ``PyMongoError`` otherwise).
+    """
+    summaries = database[CATALOG_COLLECTION]
+    _ensure_catalog_key(summaries)
+    now = pd.Timestamp.now(tz="UTC").tz_localize(None).to_pydatetime()
+    for category in categories:
+        rows = list(database[collection_name].aggregate(catalog_pipeline(category), allowDiskUse=True))
+        key = {"collection": collection_name, "category": category}
+        for r in rows:
+            doc = {**key, "value": r["_id"], "years": r["years"], "first": r["first"],
+                   "last": r["last"], "rows": r["rows"], "updated": now}
+            try:
+                summaries.replace_one({**key, "value": r["_id"]}, doc, upsert=True)
+            except DuplicateKeyError:
+                pass  # a concurrent refresh inserted this key first; its document is just as fresh
+        summaries.delete_many({**key, "value": {"$nin": [r["_id"] for r in rows]}})
+
+
+def _catalog_frame(docs, category):
+    df = pd.DataFrame(docs, columns=["value", "years", "first", "last", "rows"])
+    df = df.rename(columns={"value": category})
+    for col in ("first", "last"):
+        df[col] = pd.to_datetime(df[col], utc=True)
+    return df
+
+
+def load_catalog(database, collection_name, category, max_age=pd.Timedelta(days=1)):
+    """Summary table for one category, read from the maintained catalog documents.
+
+    The summaries are rebuilt first when missing or older than ``max_age``,
+    so the normal path reads a handful of small documents. Without write
+    access (or when the rebuild fails) stale summaries are shown as they
+    are, and with none stored the aggregation is run live.
+    """
+    query = {"collection": collection_name, "category": category}
+    projection = {"_id": 0, "value": 1, "years": 1, "first": 1, "last": 1, "rows": 1, "updated": 1}
+    docs = list(database[CATALOG_COLLECTION].find(query, projection).sort("value", 1))
+    stale = not docs or any(
+        pd.Timestamp(d["updated"], tz="UTC") < pd.Timestamp.now(tz="UTC") - max_age for d in docs
+    )
+    if stale:
+        try:
+            refresh_catalog(database, collection_name, categories=(category,))
+            docs = list(database[CATALOG_COLLECTION].find(query, projection).sort("value", 1))
+        except PyMongoError as e:
+            logger.warning("Catalog refresh of %s.%s failed: %s", collection_name, category, e)
+            if not docs:
+                rows = database[collection_name].aggregate(catalog_pipeline(category), allowDiskUse=True)
+                docs = [{**r, "value": r["_id"]} for r in rows]
+    return _catalog_frame(docs, category)
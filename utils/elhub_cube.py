@@ -0,0 +1,194 @@
+"""
+Materialised rollups of the Elhub snapshot.
+
+Built once per data refresh from the synced snapshot (``utils.elhub_sync``)
+so that widget interactions on the Elhub pages are lookups into small
+frames instead of scans of the hourly data:
+
+* ``cube``: sum, count, mean, min and max of hourly ``quantitykwh`` per
+  pricearea × group × year × month (a few thousand rows).
+* ``hourly``: one value per pricearea × group × hour, indexed by
+  (month, pricearea, group) so a month slice is a single ``.loc``.
+
+Years and months are UTC, like the rest of the Elhub code. Built cubes are
+written next to the snapshot, keyed by its version, so a new process (or
+the nightly ``python -m utils.batch``) reads them instead of rebuilding.
+"""
+import os
+import threading
+from functools import lru_cache
+
+import pandas as pd
+
+from utils.elhub import canonical_areas, compact_frame
+from utils.elhub_sync import dataset_dir, load_snapshot, sync_dataset
+
+CUBE_STATS = ["sum", "count", "mean", "min", "max"]
+
+
+class ElhubCube:
+    """Month-level ``cube`` and month-indexed ``hourly`` frames with lookup helpers."""
+
+    def __init__(self, group_field, cube, hourly):
+        self.group_field = group_field
+        self.cube = cube
+        self.hourly = hourly
+
+    @property
+    def areas(self):
+        return list(self.cube.index.unique("pricearea"))
+
+    @property
+    def groups(self):
+        return list(self.cube.index.unique(self.group_field))
+
+    @property
+    def years(self):
+        return list(self.cube.index.unique("year"))
+
+    def _select(self, areas=None, groups=None, year=None, month=None):
+        idx = self.cube.index
+        mask = pd.Series(True, index=idx)
+        if areas is not None:
+            mask &= idx.get_level_values("pricearea").isin(list(areas))
+        if groups is not None:
+            mask &= idx.get_level_values(self.group_field).isin(list(groups))
+        if year is not None:
+            mask &= idx.get_level_values("year") == int(year)
+        if month is not None:
+            mask &= idx.get_level_values("month") == int(month)
+        return self.cube[mask.to_numpy()]
+
+    def total_by(self, by, **selection):
+        """Sum of ``quantitykwh`` grouped by cube levels, e.g. ``["productiongroup"]``."""
+        part = self._select(**selection)
+        return part.groupby(level=by, observed=True)["sum"].sum().rename("quantitykwh").reset_index()
+
+    def mean_by(self, by, **selection):
+        """Mean hourly ``quantitykwh`` grouped by cube levels (exact: sum / count)."""
+        part = self._select(**selection).groupby(level=by, observed=True)[["sum", "count"]].sum()
+        return (part["sum"] / part["count"]).rename("quantitykwh").reset_index()
+
+    def hourly_by_group(self, month, areas=None, groups=None):
+        """Hourly ``quantitykwh`` per group for one month, summed over ``areas``."""
+        try:
+            part = self.hourly.loc[int(month)]
+        except KeyError:
+            return pd.DataFrame(columns=["starttime", self.group_field, "quantitykwh"])
+        idx = part.index
+        mask = pd.Series(True, index=idx)
+        if areas is not None:
+            mask &= idx.get_level_values("pricearea").isin(list(areas))
+        if groups is not None:
+            mask &= idx.get_level_values(self.group_field).isin(list(groups))
+        part = part[mask.to_numpy()].reset_index()
+        return (part.groupby(["starttime", self.group_field], as_index=False, observed=True)["quantitykwh"]
+                .sum().sort_values("starttime"))
+
+
+def build_cube(df, group_field, dedupe="sum"):
+    """Build an ``ElhubCube`` from raw Elhub rows.
+
+    Price-area spellings are first unified (``canonical_areas``), then
+    repeated (pricearea, group, starttime) rows are collapsed, summed
+    (``dedupe="sum"``) or keeping the first (``"first"``), exactly like the
+    pages did before.
+    """
+    df = compact_frame(df, group_field).dropna(subset=["starttime"])
+    df["pricearea"] = canonical_areas(df["pricearea"])
+    keys = ["pricearea", group_field, "starttime"]
+    if dedupe == "first":
+        hourly = df.drop_duplicates(subset=keys, keep="first")
+    else:
+        hourly = df.groupby(keys, as_index=False, observed=True)["quantitykwh"].sum()
+    hourly = hourly.assign(
+        year=hourly["starttime"].dt.year.astype("int16"),
+        month=hourly["starttime"].dt.month.astype("int8"),
+    )
+
+    cube = (hourly.groupby(["pricearea", group_field, "year", "month"], observed=True)["quantitykwh"]
+            .agg(CUBE_STATS).astype({"sum": "float64", "count": "int64"}))
+
+    hourly = (hourly.set_index(["month", "pricearea", group_field])[["starttime", "quantitykwh"]]
+              .sort_index())
+    return ElhubCube(group_field, cube, hourly)
+
+
+def cube_paths(dataset, dedupe, version):
+    """Parquet files of a built cube: ``.elhub_store/<db>.<coll>/cubes/<dedupe>-<version>.*.parquet``."""
+    stem = dataset_dir(dataset) / "cubes" / f"{dedupe}-{version}"
+    return stem.with_suffix(".cube.parquet"), stem.with_suffix(".hourly.parquet")
+
+
+def _stored_version(path):
+    """Snapshot version in a cube file name (``<dedupe>-<version>.cube.parquet``)."""
+    try:
+        return int(path.name.split(".", 1)[0].rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def save_cube(dataset, dedupe, version, elhub_cube):
+    """Write a built cube next to the snapshot it came from (older versions are removed)."""
+    cube_path, hourly_path = cube_paths(dataset, dedupe, version)
+    cube_path.parent.mkdir(parents=True, exist_ok=True)
+    for frame, path in ((elhub_cube.cube, cube_path), (elhub_cube.hourly, hourly_path)):
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        frame.to_parquet(tmp)
+        os.replace(tmp, path)
+    # Only older versions: a process that saw a newer snapshot keeps its files
+    for old in cube_path.parent.glob(f"{dedupe}-*.parquet"):
+        old_version = _stored_version(old)
+        if old_version is not None and old_version < version:
+            old.unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=8)
+def _cube_for_version(dataset, dedupe, version):
+    """Read the stored cube of this snapshot version, or build and store it."""
+    cube_path, hourly_path = cube_paths(dataset, dedupe, version)
+    try:
+        return ElhubCube(dataset[2], pd.read_parquet(cube_path), pd.read_parquet(hourly_path))
+    except FileNotFoundError:
+        # Not built yet, or pruned by another process that saw a newer snapshot
+        pass
+    elhub_cube = build_cube(load_snapshot(dataset), dataset[2], dedupe)
+    save_cube(dataset, dedupe, version, elhub_cube)
+    return elhub_cube
+
+
+def get_cube(dataset, dedupe="sum", refresh=True):
+    """The cube of one dataset, rebuilt only when the snapshot has changed.
+
+    With ``refresh`` the snapshot is incrementally synced from MongoDB first.
+    """
+    if refresh:
+        sync_dataset(dataset)
+    marks = dataset_dir(dataset) / "watermarks.json"
+    version = marks.stat().st_mtime_ns if marks.exists() else 0
+    return _cube_for_version(tuple(dataset), dedupe, version)
+
+
+def store_cube(database, name, elhub_cube):
+    """Write the month-level cube to ``<database>.<name>`` (replacing it)."""
+    rows = elhub_cube.cube.reset_index()
+    for col in rows.columns:
+        if isinstance(rows[col].dtype, pd.CategoricalDtype):
+            rows[col] = rows[col].astype(str)
+    docs = [{k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()}
+            for row in rows.to_dict("records")]
+    database[name].delete_many({})
+    if docs:
+        database[name].insert_many(docs)
+
+
+if __name__ == "__main__":
+    # Refresh the snapshots and publish the month cubes next to the raw collections
+    from utils.elhub_sync import DATASETS
+    from utils.mongo import get_database
+
+    for dataset in DATASETS:
+        database, collection, _ = dataset
+        cube = get_cube(dataset)
+        store_cube(get_database(database), f"{collection}_cube", cube)
+        print(f"{database}.{collection}_cube: {len(cube.cube)} rows")
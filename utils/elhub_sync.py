@@ -0,0 +1,218 @@
+"""
+Incremental Elhub sync into a local Parquet snapshot.
+
+New Elhub rows only ever arrive at the end of the time axis, so each
+(pricearea, group) keeps a high-water mark: the last ``starttime`` synced.
+A refresh asks MongoDB only for rows at or after the mark (minus a small
+overlap for late corrections), replaces that tail in the snapshot and
+rewrites only the yearly partitions whose rows actually changed:
+
+    .elhub_store/Elhub.Data/year=2024.parquet
+    .elhub_store/Elhub.Data/watermarks.json
+
+Run ``python -m utils.elhub_sync`` to refresh all three datasets.
+"""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from utils.elhub import CONSUMPTION, EXAMPLE, PRODUCTION, compact_frame, distinct_values
+from utils.mongo import get_database
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = Path(os.environ.get("ELHUB_STORE", ".elhub_store"))
+DATASETS = [PRODUCTION, CONSUMPTION, EXAMPLE]
+
+# Rows this close to the watermark are fetched again to pick up corrections
+OVERLAP = pd.Timedelta(days=1)
+
+_lock = threading.Lock()
+
+
+# ======================================================
+# Snapshot files
+# ======================================================
+def dataset_dir(dataset):
+    database, collection, _ = dataset
+    return STORE_DIR / f"{database}.{collection}"
+
+
+def read_watermarks(dataset):
+    """``{(pricearea, group): last starttime (UTC)}`` of one dataset."""
+    path = dataset_dir(dataset) / "watermarks.json"
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return {tuple(k.split("|", 1)): pd.Timestamp(v) for k, v in raw.items()}
+
+
+def _write_watermarks(dataset, marks):
+    directory = dataset_dir(dataset)
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = directory / f"watermarks.json.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({f"{a}|{g}": t.isoformat() for (a, g), t in sorted(marks.items())}, f, indent=1)
+    os.replace(tmp, directory / "watermarks.json")
+
+
+def load_snapshot(dataset, years=None):
+    """Raw synced rows (duplicates included) as one compact DataFrame.
+
+    Columns are ``pricearea``, the group field (categoricals), ``starttime``
+    (UTC) and ``quantitykwh`` (float32), see ``compact_frame``; ``years``
+    limits which partitions are read.
+    """
+    _, _, group_field = dataset
+    directory = dataset_dir(dataset)
+    paths = sorted(directory.glob("year=*.parquet"))
+    if years is not None:
+        wanted = {f"year={int(y)}.parquet" for y in years}
+        paths = [p for p in paths if p.name in wanted]
+    if not paths:
+        return compact_frame(pd.DataFrame({
+            "pricearea": pd.Series(dtype=object),
+            group_field: pd.Series(dtype=object),
+            "starttime": pd.Series(dtype="datetime64[ns, UTC]"),
+            "quantitykwh": pd.Series(dtype=float),
+        }), group_field)
+    # Partitions have their own category sets; re-encode once after concatenating
+    df = pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+    return compact_frame(df, group_field)
+
+
+def _write_partition(directory, year, df):
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"year={int(year)}.parquet"
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+# ======================================================
+# Fetching from MongoDB
+# ======================================================
+def _since_query(since):
+    """Rows with ``starttime >= since``, whether stored as BSON dates or ISO strings.
+
+    MongoDB compares values of one BSON type only, so both forms are asked
+    for. Strings compare by their local date, which can be a day behind the
+    UTC date for negative offsets ("2024-01-01T20:00-05:00" is 01:00 UTC on
+    the 2nd), so the string bound is the UTC date one day earlier; the
+    exact cut is applied after parsing.
+    """
+    bound = since.tz_convert("UTC").tz_localize(None)
+    day_before = bound.normalize() - pd.Timedelta(days=1)
+    return {"$or": [
+        {"starttime": {"$gte": bound.to_pydatetime()}},
+        {"starttime": {"$gte": day_before.strftime("%Y-%m-%d")}},
+    ]}
+
+
+def fetch_rows(collection, group_field, area, group, since=None):
+    """Rows of one (pricearea, group) at or after ``since`` (all rows if None)."""
+    query = {"pricearea": area, group_field: group}
+    if since is not None:
+        query.update(_since_query(since))
+    projection = {"_id": 0, "pricearea": 1, group_field: 1, "starttime": 1, "quantitykwh": 1}
+    df = pd.DataFrame(list(collection.find(query, projection)),
+                      columns=["pricearea", group_field, "starttime", "quantitykwh"])
+    df = compact_frame(df, group_field).dropna(subset=["starttime"])
+    if since is not None:
+        df = df[df["starttime"] >= since]
+    return df
+
+
+# ======================================================
+# Sync
+# ======================================================
+def same_rows(a, b):
+    """Whether two compact frames hold the same rows, whatever their order and category sets."""
+    if len(a) != len(b):
+        return False
+    columns = list(a.columns)
+
+    def canonical(df):
+        df = df[columns].astype({c: str for c in columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+        df["starttime"] = df["starttime"].astype("datetime64[ns, UTC]")
+        return df.sort_values(columns, kind="stable").reset_index(drop=True)
+
+    return canonical(a).equals(canonical(b))
+
+
+def sync_dataset(dataset, database=None):
+    """Bring the local snapshot of one dataset up to date.
+
+    The re-fetched overlap is compared with the stored tail; partitions
+    (and ``watermarks.json``, whose mtime versions the snapshot) are only
+    rewritten when it differs. Returns ``{"rows": rows fetched for changed
+    partitions, "pairs": pairs among them}``.
+    """
+    db_name, coll_name, group_field = dataset
+    collection = (database or get_database(db_name))[coll_name]
+    directory = dataset_dir(dataset)
+
+    with _lock:
+        marks = read_watermarks(dataset)
+        before = dict(marks)
+        pairs = [(a, g)
+                 for a in distinct_values(collection, "pricearea")
+                 for g in distinct_values(collection, group_field)]
+
+        deltas = []
+        cutoffs = {}
+        for pair in pairs:
+            since = marks[pair] - OVERLAP if pair in marks else None
+            delta = fetch_rows(collection, group_field, *pair, since=since)
+            if delta.empty:
+                continue
+            deltas.append(delta)
+            cutoffs[pair] = since
+            marks[pair] = max(marks.get(pair, delta["starttime"].max()), delta["starttime"].max())
+
+        if not deltas:
+            return {"rows": 0, "pairs": 0}
+
+        delta = pd.concat(deltas, ignore_index=True)
+        changed = []
+        for year in sorted(delta["starttime"].dt.year.unique()):
+            fetched = new = delta[delta["starttime"].dt.year == year]
+            old = load_snapshot(dataset, years=[year])
+            if not old.empty:
+                # Drop the re-fetched tail of every synced pair, then append the fresh copy
+                replaced = pd.Series(False, index=old.index)
+                for (area, group), since in cutoffs.items():
+                    tail = (old["pricearea"] == area) & (old[group_field] == group)
+                    if since is not None:
+                        tail &= old["starttime"] >= since
+                    replaced |= tail
+                if same_rows(old[replaced], new):
+                    continue  # only the overlap came back, unchanged
+                new = pd.concat([old[~replaced], new], ignore_index=True)
+            _write_partition(directory, year, new.sort_values("starttime", kind="stable"))
+            changed.append(fetched)
+
+        if not changed and marks == before:
+            # Nothing new: leave the files (and so the snapshot version) untouched
+            return {"rows": 0, "pairs": 0}
+        _write_watermarks(dataset, marks)
+
+    delta = pd.concat(changed, ignore_index=True) if changed else delta.iloc[:0]
+    pairs = delta.groupby(["pricearea", group_field], observed=True).ngroups
+    logger.info("Synced %s.%s: %d rows for %d pairs", db_name, coll_name, len(delta), pairs)
+    return {"rows": len(delta), "pairs": pairs}
+
+
+def sync_all(datasets=DATASETS):
+    return {f"{d[0]}.{d[1]}": sync_dataset(d) for d in datasets}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for name, result in sync_all().items():
+        print(f"{name}: {result['rows']} new rows for {result['pairs']} (area, group) pairs")
@@ -0,0 +1,175 @@
+"""
+Local stand-in for the Open-Meteo archive API.
+
+Serves canned hourly ERA5 responses built from the bundled
+``open-meteo-subset.csv`` in the same FlatBuffers wire format as the real
+service, so ``utils.weather`` and ``utils.prefetch`` can be exercised
+without network access:
+
+    with FakeArchiveServer() as server:
+        weather.ARCHIVE_URL = server.url
+        prefetch(city_year_jobs([2021]))
+        print(server.requests)
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import flatbuffers
+import numpy as np
+import pandas as pd
+from openmeteo_sdk.Unit import Unit
+from openmeteo_sdk.Variable import Variable
+
+SUBSET_CSV = "open-meteo-subset.csv"
+
+# Archive variable name -> (FlatBuffers variable code, unit code)
+VARIABLE_CODES = {
+    "temperature_2m": (Variable.temperature, Unit.celsius),
+    "precipitation": (Variable.precipitation, Unit.millimetre),
+    "wind_speed_10m": (Variable.wind_speed, Unit.metre_per_second),
+    "wind_gusts_10m": (Variable.wind_gusts, Unit.metre_per_second),
+    "wind_direction_10m": (Variable.wind_direction, Unit.degree_direction),
+}
+
+
+def load_canned_year(path=SUBSET_CSV):
+    """One year of hourly values per variable from the bundled CSV."""
+    df = pd.read_csv(path)
+    df.columns = [c.split(" (")[0] for c in df.columns]
+    return {name: df[name].to_numpy(dtype=np.float32) for name in VARIABLE_CODES}
+
+
+def encode_response(lat, lon, time_start, time_end, interval, utc_offset, timezone, values):
+    """One length-prefixed ``WeatherApiResponse`` message with hourly data."""
+    b = flatbuffers.Builder(1024)
+
+    var_offsets = []
+    for name, arr in values.items():
+        code, unit = VARIABLE_CODES[name]
+        vec = b.CreateNumpyVector(np.ascontiguousarray(arr, dtype=np.float32))
+        b.StartObject(13)
+        b.PrependUint8Slot(0, code, 0)
+        b.PrependUint8Slot(1, unit, 0)
+        b.PrependUOffsetTRelativeSlot(3, vec, 0)
+        var_offsets.append(b.EndObject())
+
+    b.StartVector(4, len(var_offsets), 4)
+    for off in reversed(var_offsets):
+        b.PrependUOffsetTRelative(off)
+    variables = b.EndVector()
+
+    b.StartObject(4)
+    b.PrependInt64Slot(0, time_start, 0)
+    b.PrependInt64Slot(1, time_end, 0)
+    b.PrependInt32Slot(2, interval, 0)
+    b.PrependUOffsetTRelativeSlot(3, variables, 0)
+    hourly = b.EndObject()
+
+    tz = b.CreateString(timezone)
+    b.StartObject(15)
+    b.PrependFloat32Slot(0, lat, 0.0)
+    b.PrependFloat32Slot(1, lon, 0.0)
+    b.PrependInt32Slot(6, utc_offset, 0)
+    b.PrependUOffsetTRelativeSlot(7, tz, 0)
+    b.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    b.Finish(b.EndObject())
+
+    buf = bytes(b.Output())
+    return len(buf).to_bytes(4, "little") + buf
+
+
+def canned_hourly(canned, start_date, end_date, timezone):
+    """Hourly UTC index for the local dates [start_date, end_date] and canned values for it."""
+    start = pd.Timestamp(start_date).tz_localize(timezone)
+    end = (pd.Timestamp(end_date) + pd.Timedelta(days=1)).tz_localize(timezone)
+    index = pd.date_range(start, end, freq="h", inclusive="left").tz_convert("UTC")
+    # Hour of year picks the canned row, so every year looks like the CSV year
+    local = index.tz_convert(timezone)
+    hour_of_year = (local.dayofyear.to_numpy() - 1) * 24 + local.hour.to_numpy()
+    n = len(next(iter(canned.values())))
+    rows = hour_of_year % n
+    return index, {name: arr[rows] for name, arr in canned.items()}
+
+
+class FakeArchiveServer:
+    """Threaded HTTP server answering ``/v1/archive`` like Open-Meteo.
+
+    ``delay`` adds a fixed latency per request. Every request's query string
+    is appended to ``requests``. Clients that do not ask for
+    ``format=flatbuffers`` receive the JSON body the real API returns.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, csv_path=SUBSET_CSV):
+        self.delay = delay
+        self.requests = []
+        self.canned = load_canned_year(csv_path)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = {k: v if k == "hourly" else v[0]
+                         for k, v in parse_qs(urlparse(self.path).query).items()}
+                server.requests.append(query)
+                if server.delay:
+                    time.sleep(server.delay)
+                status, ctype, body = server.respond(query)
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/v1/archive"
+        self._thread = None
+
+    def respond(self, query):
+        try:
+            names = [n for item in query.get("hourly", []) for n in item.split(",")]
+            timezone = query.get("timezone", "GMT")
+            index, values = canned_hourly(self.canned, query["start_date"], query["end_date"], timezone)
+            values = {n: values[n] for n in names}
+        except Exception as e:
+            return 400, "application/json", json.dumps({"error": True, "reason": str(e)}).encode()
+
+        if query.get("format") == "flatbuffers":
+            interval = 3600
+            start = int(index[0].timestamp())
+            utc_offset = int(pd.Timestamp(index[0]).tz_convert(timezone).utcoffset().total_seconds())
+            body = encode_response(
+                float(query["latitude"]), float(query["longitude"]),
+                start, start + len(index) * interval, interval, utc_offset, timezone, values,
+            )
+            return 200, "application/octet-stream", body
+
+        local = index.tz_convert(timezone).strftime("%Y-%m-%dT%H:%M")
+        hourly = {"time": list(local)}
+        hourly.update({n: [round(float(v), 2) for v in arr] for n, arr in values.items()})
+        body = json.dumps({
+            "latitude": float(query["latitude"]),
+            "longitude": float(query["longitude"]),
+            "timezone": timezone,
+            "hourly": hourly,
+        }).encode()
+        return 200, "application/json", body
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
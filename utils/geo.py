@@ -0,0 +1,184 @@
+"""
+Price-area geometry from ``file.geojson``: lookups and display levels.
+
+The GeoJSON (2 MB) is parsed once per process. Its polygons are prepared
+and put into an STRtree, so a map click or a batch of grid points is
+resolved with a bounding-box search plus prepared ``contains`` tests
+instead of rebuilding every polygon with ``shape()`` on each click.
+
+For drawing, the areas are simplified once at a few tolerances with
+``coverage_simplify``, which keeps shared borders identical on both sides
+(no gaps or slivers between neighbours), and written with coordinates
+quantised to the tolerance:
+
+    .geo_store/price_areas_tol=0.02.geojson     (~17 kB instead of 2.1 MB)
+
+``load_price_areas(zoom)`` picks the coarsest level whose error stays
+below one screen pixel at that Leaflet zoom. Clicks keep using the full
+resolution ``AreaIndex``.
+"""
+import json
+import math
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import shapely
+from shapely.geometry import MultiPolygon, Polygon, mapping, shape
+
+GEOJSON_PATH = "file.geojson"
+STORE_DIR = Path(os.environ.get("GEO_STORE", ".geo_store"))
+
+# Simplification tolerances in degrees, finest first; 0 is the original file
+TOLERANCES = [0.0, 0.001, 0.005, 0.02]
+
+
+class AreaIndex:
+    """Spatial index over the polygon features of one GeoJSON document.
+
+    Lookups return feature positions in ``geojson["features"]`` (the first
+    matching feature, as a linear scan would), or -1 / None outside all
+    polygons. Points on a boundary are outside, like ``Polygon.contains``.
+    """
+
+    def __init__(self, geojson_data):
+        self.geojson = geojson_data
+        features = geojson_data.get("features", [])
+        geometries, positions = [], []
+        for i, feat in enumerate(features):
+            geom = shape(feat["geometry"])
+            if isinstance(geom, (Polygon, MultiPolygon)):
+                geometries.append(geom)
+                positions.append(i)
+        self.geometries = np.array(geometries, dtype=object)
+        self.positions = np.array(positions, dtype=np.int64)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def features_at(self, lats, lons):
+        """Feature position for every (lat, lon) pair, -1 where none contains it."""
+        points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        points = np.atleast_1d(points)
+        result = np.full(len(points), -1, dtype=np.int64)
+        # Bounding-box candidates from the tree, then the exact test on the
+        # prepared polygons (a tree predicate would prepare the points instead)
+        point_idx, geom_idx = self.tree.query(points)
+        hit = shapely.contains(self.geometries[geom_idx], points[point_idx])
+        point_idx, geom_idx = point_idx[hit], geom_idx[hit]
+        if len(point_idx):
+            feature = self.positions[geom_idx]
+            # Lowest feature position per point, so overlaps resolve like the file order
+            order = np.lexsort((feature, point_idx))
+            point_idx, feature = point_idx[order], feature[order]
+            first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+            result[point_idx[first]] = feature[first]
+        return result
+
+    def feature_at(self, lat, lon):
+        """Feature position containing one point, or None."""
+        i = int(self.features_at([lat], [lon])[0])
+        return None if i < 0 else i
+
+    def property_at(self, lat, lon, key):
+        """``properties[key]`` of the feature containing a point, or None."""
+        i = self.feature_at(lat, lon)
+        return None if i is None else self.geojson["features"][i]["properties"].get(key)
+
+
+@lru_cache(maxsize=4)
+def get_area_index(path=GEOJSON_PATH):
+    """The shared ``AreaIndex`` of a GeoJSON file, built on first use."""
+    with open(path, "r", encoding="utf-8") as f:
+        return AreaIndex(json.load(f))
+
+
+# ======================================================
+# Simplified display levels
+# ======================================================
+def degrees_per_pixel(zoom):
+    """Longitude degrees covered by one pixel of a 256 px Web Mercator tile."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def tolerance_for_zoom(zoom):
+    """Coarsest stored tolerance that is still below one pixel at ``zoom``."""
+    pixel = degrees_per_pixel(zoom)
+    return max(t for t in TOLERANCES if t <= pixel)
+
+
+def level_path(tolerance):
+    return STORE_DIR / f"price_areas_tol={tolerance}.geojson"
+
+
+def _round_coords(coords, decimals):
+    if isinstance(coords[0], (int, float)):
+        return [round(c, decimals) for c in coords]
+    return [_round_coords(c, decimals) for c in coords]
+
+
+def simplified_geojson(area_index, tolerance):
+    """The areas simplified as one coverage, as GeoJSON with quantised coordinates.
+
+    Feature order and properties are unchanged, so feature positions match
+    the ``AreaIndex``.
+    """
+    geometries = shapely.coverage_simplify(area_index.geometries, tolerance)
+    # A tenth of the tolerance is far below anything the simplification kept
+    decimals = max(0, math.ceil(-math.log10(tolerance))) + 1
+    features = [dict(f) for f in area_index.geojson["features"]]
+    for pos, geom in zip(area_index.positions, geometries):
+        geometry = mapping(geom)
+        features[pos]["geometry"] = {
+            "type": geometry["type"],
+            "coordinates": _round_coords(geometry["coordinates"], decimals),
+        }
+    return {"type": "FeatureCollection", "features": features}
+
+
+def build_levels(path=GEOJSON_PATH):
+    """Write every simplified level of ``path`` to the store; returns their sizes in bytes."""
+    area_index = get_area_index(path)
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    sizes = {}
+    for tolerance in TOLERANCES:
+        if tolerance == 0:
+            continue
+        out = level_path(tolerance)
+        # Unique per writer: concurrent first sessions may build the levels at the same time
+        tmp = out.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(simplified_geojson(area_index, tolerance), f, separators=(",", ":"))
+        os.replace(tmp, out)
+        sizes[tolerance] = out.stat().st_size
+    return sizes
+
+
+@lru_cache(maxsize=len(TOLERANCES))
+def load_level(tolerance, path=GEOJSON_PATH):
+    """Price-area GeoJSON at one of ``TOLERANCES``, built on first use (read-only)."""
+    if tolerance == 0:
+        return get_area_index(path).geojson
+    level = level_path(tolerance)
+    if not level.exists():
+        build_levels(path)
+    with open(level, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_price_areas(zoom=None, path=GEOJSON_PATH):
+    """Price-area GeoJSON simplified for drawing at Leaflet ``zoom`` (full resolution if None).
+
+    Levels are built on first use and shared by the whole process; treat
+    the result as read-only.
+    """
+    return load_level(0.0 if zoom is None else tolerance_for_zoom(zoom), path)
+
+
+if __name__ == "__main__":
+    for tolerance, size in build_levels().items():
+        print(f"{level_path(tolerance)}: {size / 1024:.0f} kB")
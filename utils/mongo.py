@@ -0,0 +1,180 @@
+"""
+One pooled MongoClient per process.
+
+Every page and every user session shares the same client, so TLS
+handshakes, SRV lookups and server discovery happen once per process
+instead of once per cache miss. Pool sizes and timeouts can be tuned with
+environment variables; pool activity is recorded by ``PoolMetrics`` so the
+pool can be sized under concurrent load.
+"""
+import atexit
+import os
+import threading
+import time
+
+import certifi
+from pymongo import MongoClient, monitoring
+
+POOL_OPTIONS = {
+    "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 20)),
+    "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 2)),
+    "maxIdleTimeMS": 5 * 60 * 1000,
+    "waitQueueTimeoutMS": 10 * 1000,
+    "serverSelectionTimeoutMS": 10 * 1000,
+    "connectTimeoutMS": 10 * 1000,
+    "retryReads": True,
+    "appname": "ind320-dashboard",
+}
+
+
+# ======================================================
+# Pool metrics
+# ======================================================
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters fed by pymongo's CMAP events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.created = 0
+            self.closed = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_total_s = 0.0
+            self.wait_max_s = 0.0
+            self.pool_clears = 0
+
+    def snapshot(self):
+        """Current counters as a plain dict (for the sidebar or a log line)."""
+        with self._lock:
+            return {
+                "open_connections": self.created - self.closed,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_mean_ms": 1000 * self.wait_total_s / self.checkouts if self.checkouts else 0.0,
+                "wait_max_ms": 1000 * self.wait_max_s,
+                "pool_clears": self.pool_clears,
+            }
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_checked_out(self, event):
+        wait = event.duration or 0.0
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_total_s += wait
+            self.wait_max_s = max(self.wait_max_s, wait)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+metrics = PoolMetrics()
+
+_client = None
+_client_lock = threading.Lock()
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+# ======================================================
+# Client
+# ======================================================
+def mongo_uri():
+    """``MONGO_URI`` from the environment, else the Streamlit secret."""
+    uri = os.environ.get("MONGO_URI")
+    if uri:
+        return uri
+    import streamlit as st
+    return st.secrets["mongo"]["uri"]
+
+
+def is_local(uri):
+    """True when every host of a ``mongodb://`` URI is this machine."""
+    if not uri.startswith("mongodb://"):
+        return False
+    hosts = uri[len("mongodb://"):].split("/", 1)[0].split("?", 1)[0].rpartition("@")[2]
+    names = [h.rsplit("]", 1)[0].lstrip("[") if h.startswith("[") else h.split(":", 1)[0]
+             for h in hosts.split(",")]
+    return all(name.lower() in LOCAL_HOSTS for name in names)
+
+
+def get_client():
+    """The shared client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                uri = mongo_uri()
+                options = dict(POOL_OPTIONS)
+                # Every remote server is reached over TLS, verified against certifi's
+                # CA bundle; only a local mongod is left to the URI's own options
+                if not is_local(uri):
+                    options.update(tls=True, tlsCAFile=certifi.where())
+                _client = MongoClient(uri, event_listeners=[metrics], **options)
+    return _client
+
+
+def get_database(name):
+    return get_client()[name]
+
+
+def ping():
+    """Round trip to the server; returns ``(ok, latency_ms, error)``."""
+    t0 = time.perf_counter()
+    try:
+        get_client().admin.command("ping")
+        return True, 1000 * (time.perf_counter() - t0), None
+    except Exception as e:
+        return False, 1000 * (time.perf_counter() - t0), repr(e)
+
+
+def close_client():
+    """Close the shared client and its monitor threads; the next use reconnects."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close_client)
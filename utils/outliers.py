@@ -0,0 +1,157 @@
+"""
+Headless outlier detection for the weather series.
+
+``detect_temperature_outliers`` takes any number of hourly temperature
+series (e.g. every city × year) and runs the Extreme Event page's method
+on all of them at once: the Butterworth low-pass is designed once, series
+of equal length are stacked into a 2-D array and filtered with one
+``filtfilt`` call along the time axis, and the MAD-based SPC limits are
+computed per row with vectorised medians. Rows are filtered independently,
+so each result is identical to filtering that series on its own.
+
+``local_outlier_factor_1d`` is an exact one-dimensional LOF for the
+precipitation tab. On sorted data the k nearest neighbours of a point lie
+within k positions of it, so the neighbour search is a sort plus a
+``2k``-wide window instead of a tree query. Points with equal values have
+identical neighbourhoods, so the work is done once per distinct value. The
+scores and labels match scikit-learn's ``LocalOutlierFactor``.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy.signal import butter, filtfilt
+
+from utils.weather import download_era5_openmeteo, price_areas
+
+MAD_TO_SIGMA = 1.4826
+
+
+@lru_cache(maxsize=32)
+def lowpass_filter(cutoff_hours=400, sample_rate_hours=1, order=4):
+    """Butterworth low-pass ``(b, a)`` for a cutoff period in hours."""
+    nyquist = 0.5 / sample_rate_hours
+    normal_cutoff = (1 / cutoff_hours) / nyquist
+    return butter(N=order, Wn=normal_cutoff, btype="low", analog=False)
+
+
+def _spc_rows(x, b, a, n_std):
+    """Trend, limits and outlier mask for every row of a 2-D array."""
+    trend = filtfilt(b, a, x, axis=1)
+    residual = x - trend
+    med = np.median(residual, axis=1, keepdims=True)
+    sigma_hat = MAD_TO_SIGMA * np.median(np.abs(residual - med), axis=1, keepdims=True)
+    upper = trend + n_std * sigma_hat
+    lower = trend - n_std * sigma_hat
+    return trend, lower, upper, (x > upper) | (x < lower)
+
+
+def detect_temperature_outliers(series_by_key, cutoff_hours=400, sample_rate_hours=1, n_std=2.0):
+    """Low-pass trend and trend-following SPC limits for many temperature series.
+
+    ``series_by_key`` maps any key (e.g. ``(city, year)``) to an hourly
+    Series. Returns ``{key: DataFrame}`` with columns ``temperature``,
+    ``trend``, ``lower``, ``upper`` and ``outlier`` (bool) on the sorted,
+    NaN-free index of each series.
+    """
+    b, a = lowpass_filter(cutoff_hours, sample_rate_hours)
+    prepared = {key: s.dropna().sort_index() for key, s in series_by_key.items()}
+
+    # Same-length series share one 2-D pass (leap years and partial years form their own groups)
+    by_length = {}
+    for key, s in prepared.items():
+        by_length.setdefault(len(s), []).append(key)
+
+    fits = {}
+    for length, keys in by_length.items():
+        if length <= 3 * max(len(a), len(b)):
+            # Too short for filtfilt's edge padding
+            for key in keys:
+                fits[key] = pd.DataFrame(columns=["temperature", "trend", "lower", "upper", "outlier"])
+            continue
+        x = np.vstack([prepared[key].to_numpy(dtype=float) for key in keys])
+        trend, lower, upper, mask = _spc_rows(x, b, a, n_std)
+        for row, key in enumerate(keys):
+            fits[key] = pd.DataFrame({
+                "temperature": x[row],
+                "trend": trend[row],
+                "lower": lower[row],
+                "upper": upper[row],
+                "outlier": mask[row],
+            }, index=prepared[key].index)
+    return fits
+
+
+def local_outlier_factor_1d(values, n_neighbors=20):
+    """``negative_outlier_factor_`` of scikit-learn's LOF for one-dimensional data.
+
+    Uses the same reachability distances, lrd and mean-ratio arithmetic as
+    scikit-learn, applied to the same sorted neighbour distances. The scores
+    are bit-for-bit equal whenever scikit-learn searches with a tree, and
+    equal to rounding for tiny inputs where it uses brute force. Neighbours
+    exactly equidistant on both sides are taken left first.
+    """
+    x = np.asarray(values, dtype=np.float64).ravel()
+    n = len(x)
+    if n < 2:
+        return -np.ones(n)
+    k = max(1, min(n_neighbors, n - 1))
+
+    order = np.argsort(x, kind="stable")
+    xs = x[order]
+    # One representative (first sorted position) per distinct value
+    _, first, sorted_uid = np.unique(xs, return_index=True, return_inverse=True)
+    uid = np.empty(n, dtype=np.intp)
+    uid[order] = sorted_uid
+
+    # Candidates: the k positions on either side of the representative (itself excluded)
+    offsets = np.r_[np.arange(-k, 0), np.arange(1, k + 1)]
+    cand = first[:, None] + offsets
+    inside = (cand >= 0) & (cand < n)
+    cand = np.clip(cand, 0, n - 1)
+    d = np.where(inside, np.abs(xs[cand] - xs[first][:, None]), np.inf)
+    nearest = np.argsort(d, axis=1, kind="stable")[:, :k]
+    dist = np.take_along_axis(d, nearest, axis=1)
+    neighbours = sorted_uid[np.take_along_axis(cand, nearest, axis=1)]
+
+    # Same steps as LocalOutlierFactor.fit, on one row per distinct value
+    dist_k = dist[:, k - 1]
+    reach_dist = np.maximum(dist, dist_k[neighbours])
+    lrd = 1.0 / (np.mean(reach_dist, axis=1) + 1e-10)
+    score = -np.mean(lrd[neighbours] / lrd[:, np.newaxis], axis=1)
+    return score[uid]
+
+
+def lof_predict_1d(values, contamination=0.01, n_neighbors=20):
+    """``LocalOutlierFactor(...).fit_predict`` for one-dimensional data: -1 = outlier, 1 = inlier."""
+    score = local_outlier_factor_1d(values, n_neighbors)
+    offset = -1.5 if contamination == "auto" else np.percentile(score, 100.0 * contamination)
+    return np.where(score < offset, -1, 1)
+
+
+def detect_precipitation_outliers(precipitation, contamination=0.01, n_neighbors=20):
+    """LOF anomalies among the non-zero hours of an hourly precipitation series.
+
+    Scores ``log1p`` of the wet hours, as the Extreme Event page does, and
+    returns the anomalous hours as a one-column DataFrame.
+    """
+    p = precipitation.fillna(0).sort_index()
+    wet = p[p.to_numpy() > 0]
+    if wet.empty:
+        return wet.to_frame()
+    labels = lof_predict_1d(np.log1p(wet.to_numpy(dtype=float)), contamination, n_neighbors)
+    return wet[labels == -1].to_frame()
+
+
+def outlier_table(fit):
+    """The outliers of one fit as the page shows them: a ``temperature`` column."""
+    return fit.loc[fit["outlier"], ["temperature"]]
+
+
+def city_year_temperatures(years, cities=price_areas, timezone="Europe/Oslo"):
+    """``{(city, year): hourly temperature}`` from the ERA5 store (missing years are fetched)."""
+    return {
+        (c["city"], y): download_era5_openmeteo(c["latitude"], c["longitude"], y, timezone)["temperature_2m"]
+        for c in cities
+        for y in years
+    }
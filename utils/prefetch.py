@@ -0,0 +1,244 @@
+"""
+Background warm-up of the ERA5 store.
+
+A bounded thread pool fills the Parquet store (see ``utils.weather``) for
+every city × year combination, so the first selection of a city on a page
+is a disk read instead of a multi-second download. All requests go through
+a token bucket sized to the Open-Meteo free-tier limits, and a daily budget
+that stops (or parks) callers once the day's calls are spent.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from utils.weather import fill_gaps, price_areas
+
+logger = logging.getLogger(__name__)
+
+# Open-Meteo free tier: 600 calls/minute, 5 000 calls/hour, 10 000 calls/day.
+# The bucket starts full, so any window of t seconds allows at most
+# BURST + t * RATE calls: 500 + 75 = 575 per minute, 500 + 4 500 = 5 000 per
+# hour. The daily cap is enforced separately by ``DailyBudget``.
+OPENMETEO_CALLS_PER_DAY = 10000
+OPENMETEO_BURST = 500
+OPENMETEO_CALLS_PER_SECOND = (5000 - OPENMETEO_BURST) / 3600
+
+
+# ======================================================
+# Rate limiting
+# ======================================================
+class QuotaExhausted(RuntimeError):
+    """The daily call budget is spent; no request was sent."""
+
+
+def _next_utc_midnight():
+    return (pd.Timestamp.now(tz="UTC").normalize() + pd.Timedelta(days=1)).timestamp()
+
+
+class DailyBudget:
+    """Calls per UTC day, shared by every thread that holds it.
+
+    Once the day's ``limit`` is spent, ``take`` raises ``QuotaExhausted``, or
+    with ``wait=True`` sleeps until the next UTC day. Only calls made through
+    this object are counted.
+    """
+
+    def __init__(self, limit=OPENMETEO_CALLS_PER_DAY, wait=False):
+        self.limit = int(limit)
+        self.wait = wait
+        self.used = 0
+        self._resets_at = _next_utc_midnight()
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        if time.time() >= self._resets_at:
+            self.used = 0
+            self._resets_at = _next_utc_midnight()
+
+    def remaining(self):
+        with self._lock:
+            self._roll()
+            return self.limit - self.used
+
+    def take(self, tokens=1):
+        while True:
+            with self._lock:
+                self._roll()
+                if self.used + tokens <= self.limit:
+                    self.used += tokens
+                    return
+                if not self.wait:
+                    raise QuotaExhausted(f"{self.used} of {self.limit} daily Open-Meteo calls used")
+                wait = self._resets_at - time.time()
+            time.sleep(max(wait, 1.0))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``acquire`` blocks until enough tokens exist.
+
+    With a ``daily`` budget every acquisition is also charged against it.
+    """
+
+    def __init__(self, rate=OPENMETEO_CALLS_PER_SECOND, capacity=OPENMETEO_BURST, daily=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.daily = daily
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """Take ``tokens`` from the bucket, sleeping while it is too empty.
+
+        Requests heavier than the whole bucket are allowed once it is full.
+        Raises ``QuotaExhausted`` when the daily budget refuses the request.
+        """
+        if self.daily is not None:
+            self.daily.take(tokens)
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@lru_cache(maxsize=1)
+def shared_limiter():
+    """The process-wide bucket with the daily budget, shared by every job in this process."""
+    return TokenBucket(daily=DailyBudget())
+
+
+# ======================================================
+# Progress reporting
+# ======================================================
+class WarmupReport:
+    """Progress and per-job latency of one prefetch run, safe to read while it runs."""
+
+    def __init__(self, total=0):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.requests = 0
+        self.latencies = []
+        self.errors = []
+        self.started = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, job, latency, n_requests=0, error=None):
+        with self._lock:
+            self.done += 1
+            self.requests += n_requests
+            self.latencies.append(latency)
+            if error is not None:
+                self.failed += 1
+                self.errors.append((job, repr(error)))
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    def summary(self):
+        """Counts plus p50/p95/max latency in seconds."""
+        with self._lock:
+            lat = np.array(self.latencies) if self.latencies else np.zeros(1)
+            return {
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "requests": self.requests,
+                "p50_s": float(np.percentile(lat, 50)),
+                "p95_s": float(np.percentile(lat, 95)),
+                "max_s": float(lat.max()),
+                "elapsed_s": (self.finished or time.time()) - self.started,
+            }
+
+
+# ======================================================
+# Prefetch
+# ======================================================
+def city_year_jobs(years, cities=price_areas, timezone="Europe/Oslo"):
+    """One (lat, lon, start_date, end_date, timezone) job per city and year."""
+    return [
+        (c["latitude"], c["longitude"], f"{y}-01-01", f"{y}-12-31", timezone)
+        for c in cities
+        for y in years
+    ]
+
+
+def _run_job(job, limiter):
+    lat, lon, start_date, end_date, timezone = job
+    today = pd.Timestamp.now(tz=timezone).tz_localize(None).normalize()
+    end = min(pd.Timestamp(end_date), today)
+    return fill_gaps(round(float(lat), 4), round(float(lon), 4), start_date, end, timezone, limiter=limiter)
+
+
+def prefetch(jobs, max_workers=4, limiter=None, report=None):
+    """Fill the store for every job on a bounded thread pool.
+
+    Failures are logged and counted in the report; they never abort the run.
+    Once the daily budget is spent the remaining jobs fail with
+    ``QuotaExhausted`` without sending requests.
+    """
+    limiter = limiter or shared_limiter()
+    report = report or WarmupReport()
+    report.total = len(jobs)
+
+    def timed(job):
+        t0 = time.perf_counter()
+        try:
+            n = _run_job(job, limiter)
+            return job, time.perf_counter() - t0, n, None
+        except Exception as e:  # one bad city/year must not stop the others
+            return job, time.perf_counter() - t0, 0, e
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="era5-prefetch") as pool:
+        futures = [pool.submit(timed, job) for job in jobs]
+        for future in as_completed(futures):
+            job, latency, n, error = future.result()
+            report.record(job, latency, n, error)
+            if error is not None:
+                logger.warning("ERA5 prefetch failed for %s: %s", job, error)
+            else:
+                logger.info("ERA5 prefetch %s: %d request(s) in %.2fs", job, n, latency)
+
+    report.finished = time.time()
+    return report
+
+
+def start_background_warmup(years, cities=price_areas, max_workers=4, interval=None, limiter=None):
+    """Run ``prefetch`` for all city × year jobs on a daemon thread.
+
+    With ``interval`` (seconds) the warm-up repeats on that schedule, which
+    picks up newly published days of the current year. Returns a dict whose
+    ``"report"`` entry always points at the latest ``WarmupReport``.
+    """
+    jobs = city_year_jobs(years, cities)
+    state = {"report": WarmupReport(total=len(jobs))}
+    limiter = limiter or shared_limiter()
+
+    def loop():
+        while True:
+            prefetch(jobs, max_workers=max_workers, limiter=limiter, report=state["report"])
+            logger.info("ERA5 warm-up finished: %s", state["report"].summary())
+            if interval is None:
+                return
+            time.sleep(interval)
+            state["report"] = WarmupReport(total=len(jobs))
+
+    threading.Thread(target=loop, name="era5-warmup", daemon=True).start()
+    return state
@@ -0,0 +1,114 @@
+"""
+Snow drift (Tabler, 2003) computed with NumPy array operations.
+
+Same formulas and results as the per-hour loops that used to live in
+``pages/Snowdrift.py``; see ``benchmarks/snowdrift.py`` for the comparison.
+Wind speeds are raised to 3.8 once per call, sectors are binned with
+``bincount`` and all seasons are reduced in one grouped pass instead of one
+boolean mask and copy per season. Missing hours (NaN, e.g. the
+not yet published end of the current season) are skipped.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.weather import season_labels
+
+TABLER_DIVISOR = 233847
+N_SECTORS = 16
+
+# Store columns the kernels read (see ``utils.weather.load_era5_range``)
+SNOWDRIFT_COLUMNS = ["temperature_2m", "precipitation", "wind_speed_10m", "wind_direction_10m", "season"]
+
+
+def _transport_per_hour(hourly_wind_speeds, dt=3600):
+    u = np.asarray(hourly_wind_speeds, dtype=np.float64)
+    return np.nan_to_num((u ** 3.8) * dt / TABLER_DIVISOR)
+
+
+def compute_Qupot(hourly_wind_speeds, dt=3600):
+    """Potential wind-driven transport, sum(u^3.8 · dt) / 233847."""
+    return float(_transport_per_hour(hourly_wind_speeds, dt).sum())
+
+
+def sector_index(direction):
+    """16-point compass sector (0 = N) of one direction or an array of them."""
+    idx = ((np.asarray(direction, dtype=np.float64) + 11.25) % 360) // 22.5
+    return idx.astype(np.int64) if idx.ndim else int(idx)
+
+
+def compute_sector_transport(hourly_wind_speeds, hourly_wind_dirs, dt=3600):
+    """Transport per 16 direction sectors."""
+    q = _transport_per_hour(hourly_wind_speeds, dt)
+    d = np.asarray(hourly_wind_dirs, dtype=np.float64).reshape(-1)
+    ok = np.isfinite(d)
+    return np.bincount(sector_index(d[ok]), weights=q[ok], minlength=N_SECTORS).tolist()
+
+
+def compute_snow_transport(T, F, theta, Swe, hourly_wind_speeds, dt=3600):
+    """Tabler's mean annual transport Qt and its control regime."""
+    return tabler_transport(T, F, theta, Swe, compute_Qupot(hourly_wind_speeds, dt))
+
+
+def tabler_transport(T, F, theta, Swe, Qupot):
+    """``compute_snow_transport`` for an already summed Qupot."""
+    Qspot = 0.5 * T * Swe
+    Srwe = theta * Swe
+    if Qupot > Qspot:
+        Qinf = 0.5 * T * Srwe
+        control = "Snowfall controlled"
+    else:
+        Qinf = Qupot
+        control = "Wind controlled"
+    Qt = Qinf * (1 - 0.14 ** (F / T))
+    return {"Qupot": Qupot, "Qspot": Qspot, "Srwe": Srwe, "Qinf": Qinf, "Qt": Qt, "Control": control}
+
+
+def swe_hourly(df):
+    """Snow water equivalent per hour: precipitation when below 1 °C, else 0."""
+    precip = np.nan_to_num(df["precipitation"].to_numpy(dtype=np.float64))
+    return np.where(df["temperature_2m"].to_numpy(dtype=np.float64) < 1, precip, 0.0)
+
+
+def _season_codes(df):
+    """Sorted distinct seasons and each row's position among them."""
+    season = df["season"].to_numpy() if "season" in df.columns else season_labels(df.index)
+    return np.unique(season, return_inverse=True)
+
+
+def compute_yearly_results(df, T, F, theta):
+    """Qt per July–June season of an hourly frame.
+
+    Uses the stored ``season`` column when present (see
+    ``utils.weather.season_labels``). All seasons' Swe and Qupot totals come
+    from one grouped ``bincount`` pass, so the cost is linear in the number
+    of hours whatever the number of seasons.
+    """
+    seasons, season_of_row = _season_codes(df)
+    swe = np.bincount(season_of_row, weights=swe_hourly(df), minlength=len(seasons))
+    qupot = np.bincount(season_of_row, weights=_transport_per_hour(df["wind_speed_10m"]),
+                        minlength=len(seasons))
+
+    results_list = []
+    for s, total_swe, total_q in zip(seasons, swe, qupot):
+        result = tabler_transport(T, F, theta, float(total_swe), float(total_q))
+        result["season"] = f"{s}-{s+1}"
+        results_list.append(result)
+    return pd.DataFrame(results_list)
+
+
+def compute_season_sectors(df):
+    """Season labels and the (seasons × 16) sector transport matrix."""
+    q = _transport_per_hour(df["wind_speed_10m"])
+    d = df["wind_direction_10m"].to_numpy(dtype=np.float64)
+    season_codes, season_of_row = _season_codes(df)
+    ok = np.isfinite(d)
+    # One bincount over (season, sector) pairs gives every season's rose at once
+    flat = season_of_row[ok] * N_SECTORS + sector_index(d[ok])
+    q = q[ok]
+    per_season = np.bincount(flat, weights=q, minlength=len(season_codes) * N_SECTORS)
+    return season_codes, per_season.reshape(len(season_codes), N_SECTORS)
+
+
+def compute_average_sector(df):
+    """Mean over seasons of the 16-sector transport."""
+    return compute_season_sectors(df)[1].mean(axis=0)
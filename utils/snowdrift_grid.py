@@ -0,0 +1,196 @@
+"""
+Snow drift over a regular grid covering the price-area polygons.
+
+Every grid point inside ``file.geojson`` gets, per July–June season, the
+mean annual transport Qt, its control regime and the dominant transport
+sector. A run has two phases:
+
+1. Download: the ERA5 store is filled for every cell with the rate-limited
+   thread pool from ``utils.prefetch`` (network bound, shared token bucket).
+2. Compute: a process pool reads each cell from the store (no network) and
+   runs the vectorised kernels from ``utils.snowdrift`` (CPU bound).
+
+The result is one Parquet table that the Snowdrift page draws as a heat
+map layer, plus the cells that have no data yet (download failed, or the
+daily quota ran out), which the page lists next to the heat map:
+
+    .era5_store/snowdrift_grid/step=0.5.parquet
+    .era5_store/snowdrift_grid/step=0.5.missing.parquet
+
+ERA5 itself is on a 0.25° grid. At the default 0.5° there are about 360
+cells, and each season costs roughly 27 Open-Meteo call units per cell, so
+a full grid does not fit in one day's quota. Downloads go through the
+process-wide daily budget of ``utils.prefetch``: once it is spent the
+remaining cells are recorded as missing without sending requests. The
+store is resumable, so rerunning on the following days fills them in.
+
+    python -m utils.snowdrift_grid --from 2020 --to 2022 --step 0.5
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from utils.geo import GEOJSON_PATH, get_area_index
+from utils.prefetch import prefetch, shared_limiter
+from utils.snowdrift import SNOWDRIFT_COLUMNS, compute_season_sectors, compute_yearly_results
+from utils.weather import STORE_DIR, load_era5_range
+
+logger = logging.getLogger(__name__)
+
+GRID_STEP = 0.5
+
+# Same snow fence parameters as the Snowdrift page
+T, F, THETA = 3000, 30000, 0.5
+
+DIRECTIONS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+              'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+
+
+# ======================================================
+# Grid
+# ======================================================
+def grid_cells(area_index, step=GRID_STEP):
+    """``(lat, lon, area)`` of every grid point inside a price-area polygon.
+
+    Points are on multiples of ``step`` degrees, so they line up with the
+    ERA5 grid for any multiple of 0.25.
+    """
+    min_lon, min_lat, max_lon, max_lat = shapely.total_bounds(area_index.geometries)
+    lats = np.arange(np.ceil(min_lat / step), np.floor(max_lat / step) + 1) * step
+    lons = np.arange(np.ceil(min_lon / step), np.floor(max_lon / step) + 1) * step
+    lat_grid, lon_grid = (a.ravel() for a in np.meshgrid(lats, lons, indexing="ij"))
+    features = area_index.features_at(lat_grid, lon_grid)
+    labels = [f["properties"]["ElSpotOmr"] for f in area_index.geojson["features"]]
+    return [(round(float(lat), 4), round(float(lon), 4), labels[i])
+            for lat, lon, i in zip(lat_grid, lon_grid, features) if i >= 0]
+
+
+def grid_path(step=GRID_STEP):
+    return STORE_DIR / "snowdrift_grid" / f"step={step}.parquet"
+
+
+def missing_path(step=GRID_STEP):
+    return STORE_DIR / "snowdrift_grid" / f"step={step}.missing.parquet"
+
+
+def _write_table(table, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    table.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+# ======================================================
+# Per-cell computation (runs in worker processes)
+# ======================================================
+def cell_seasons(cell, start_season, end_season, timezone="Europe/Oslo"):
+    """One result row per season for one grid cell, read from the store only."""
+    lat, lon, area = cell
+    df = load_era5_range(lat, lon, f"{start_season}-07-01", f"{end_season + 1}-06-30",
+                         timezone, fetch=False, columns=SNOWDRIFT_COLUMNS)
+    if df.empty:
+        return []
+
+    yearly = compute_yearly_results(df, T, F, THETA)
+    seasons, sectors = compute_season_sectors(df)
+    dominant = dict(zip((f"{s}-{s+1}" for s in seasons), sectors.argmax(axis=1)))
+
+    rows = []
+    for r in yearly.itertuples(index=False):
+        rows.append({
+            "lat": lat,
+            "lon": lon,
+            "area": area,
+            "season": r.season,
+            "Qt": r.Qt,
+            "Control": r.Control,
+            "sector": DIRECTIONS[dominant[r.season]],
+        })
+    return rows
+
+
+def _cell_job(args):
+    return cell_seasons(*args)
+
+
+# ======================================================
+# Batch run
+# ======================================================
+def compute_grid(start_season, end_season, step=GRID_STEP, geojson_path=GEOJSON_PATH,
+                 download=True, max_workers=None, timezone="Europe/Oslo", limiter=None):
+    """Compute the snow drift table for every grid cell and write it to ``grid_path``.
+
+    Cells without rows (failed download, quota spent, nothing in the store)
+    are written to ``missing_path`` with the reason. Returns the table
+    (lat, lon, area, season, Qt, Control, sector).
+    """
+    cells = grid_cells(get_area_index(geojson_path), step)
+    logger.info("%d grid cells at %s°", len(cells), step)
+
+    download_errors = {}
+    if download:
+        jobs = [(lat, lon, f"{start_season}-07-01", f"{end_season + 1}-06-30", timezone)
+                for lat, lon, _ in cells]
+        report = prefetch(jobs, limiter=limiter or shared_limiter())
+        logger.info("Download finished: %s", report.summary())
+        download_errors = {(job[0], job[1]): error for job, error in report.errors}
+
+    t0 = time.perf_counter()
+    args = [(cell, start_season, end_season, timezone) for cell in cells]
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        per_cell = list(pool.map(_cell_job, args, chunksize=8))
+    logger.info("Computed %d cells in %.1fs", len(cells), time.perf_counter() - t0)
+
+    rows = [row for cell_rows in per_cell for row in cell_rows]
+    table = pd.DataFrame(rows, columns=["lat", "lon", "area", "season", "Qt", "Control", "sector"])
+    table = table.astype({"lat": "float32", "lon": "float32", "Qt": "float32",
+                          "area": "category", "season": "category",
+                          "Control": "category", "sector": "category"})
+    missing = pd.DataFrame(
+        [(lat, lon, area, download_errors.get((lat, lon), "no data in the store"))
+         for (lat, lon, area), cell_rows in zip(cells, per_cell) if not cell_rows],
+        columns=["lat", "lon", "area", "reason"])
+    if len(missing):
+        logger.warning("%d of %d grid cells have no data and are left out of the table",
+                       len(missing), len(cells))
+
+    _write_table(table, grid_path(step))
+    _write_table(missing, missing_path(step))
+    return table
+
+
+def load_grid(step=GRID_STEP):
+    """The precomputed table, or None when no batch run has been made yet."""
+    path = grid_path(step)
+    if not path.exists():
+        return None
+    return pd.read_parquet(path)
+
+
+def load_missing(step=GRID_STEP):
+    """Cells left out of the last batch run (lat, lon, area, reason); empty if none."""
+    path = missing_path(step)
+    if not path.exists():
+        return pd.DataFrame(columns=["lat", "lon", "area", "reason"])
+    return pd.read_parquet(path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Precompute snow drift over the price-area grid.")
+    parser.add_argument("--from", dest="start", type=int, required=True, help="first season (start year)")
+    parser.add_argument("--to", dest="end", type=int, required=True, help="last season (start year)")
+    parser.add_argument("--step", type=float, default=GRID_STEP, help="grid spacing in degrees")
+    parser.add_argument("--workers", type=int, default=None, help="compute processes")
+    parser.add_argument("--no-download", action="store_true", help="only use data already in the store")
+    a = parser.parse_args()
+    table = compute_grid(a.start, a.end, step=a.step, download=not a.no_download, max_workers=a.workers)
+    print(f"{len(table)} rows written to {grid_path(a.step)}; "
+          f"{len(load_missing(a.step))} cells missing, see {missing_path(a.step)}")
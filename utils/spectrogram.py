@@ -0,0 +1,156 @@
+"""
+Batched spectrograms of hourly series.
+
+The windows of all requested series are detrended and transformed in
+fixed-size chunks through one reused buffer, writing straight into a
+single ``[window, freq]`` power matrix that every result views. The
+result matches ``scipy.signal.spectrogram`` (Hann window, constant
+detrend, density scaling, one-sided) window for window. Power matrices are kept in a small
+in-process cache keyed by a content hash of the series and the window
+parameters, so switching between series or tabs reuses them.
+
+Measured with ``python -m benchmarks.spectrogram`` (best of 10, 25 series):
+the chunked transform runs at the speed of a scipy loop, and a cold call
+is 10-20 % slower than the loop once hashing and gap filling are counted.
+The gain is the cache: a repeated view costs about a third of recomputing.
+
+For display the dB grid is reduced to about one column per screen pixel
+and returned with real window-centre timestamps.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy.signal import get_window
+
+CACHE_SIZE = 64
+CHUNK = 256  # windows per rfft call
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Spectrogram:
+    """Power spectral density per window: ``power[freq, window]``."""
+
+    def __init__(self, freqs, times, power):
+        self.freqs = freqs
+        self.times = times
+        self.power = power
+
+    def db(self):
+        return 10 * np.log10(self.power + 1e-12)
+
+    def decimated(self, max_columns=1000):
+        """dB grid with at most ``max_columns`` time columns (mean power per block).
+
+        Returns ``(times, freqs, db)``; each column is placed at the middle
+        of the windows it covers.
+        """
+        n = self.power.shape[1]
+        step = max(1, -(-n // max_columns))
+        if step == 1:
+            return self.times, self.freqs, self.db()
+        edges = np.arange(0, n, step)
+        power = np.add.reduceat(self.power, edges, axis=1) / np.diff(np.r_[edges, n])
+        mid = np.minimum(edges + step // 2, n - 1)
+        return self.times[mid], self.freqs, 10 * np.log10(power + 1e-12)
+
+
+def _key(values, start, nperseg, noverlap, fs):
+    h = hashlib.sha256(values.tobytes())
+    h.update(repr((start, nperseg, noverlap, fs)).encode())
+    return h.hexdigest()
+
+
+def _hourly_values(series):
+    """Sorted, regular hourly float64 values (gaps interpolated) and the first timestamp."""
+    idx = series.index
+    values = series.to_numpy(dtype=np.float64)
+    if len(idx) == 0:
+        return np.empty(0), None
+    regular = (idx.is_monotonic_increasing and idx.is_unique
+               and idx[-1] - idx[0] == (len(idx) - 1) * pd.Timedelta(hours=1))
+    if regular and np.isfinite(values).all():
+        return values, idx[0]
+
+    s = series.dropna().astype(float).sort_index()
+    if s.empty:
+        return np.empty(0), None
+    s = s[~s.index.duplicated(keep="first")]
+    s = s.asfreq("h").interpolate(method="time")
+    return s.to_numpy(dtype=np.float64), s.index[0]
+
+
+def _windows(values, nperseg, noverlap):
+    step = nperseg - noverlap
+    return np.lib.stride_tricks.sliding_window_view(values, nperseg)[::step]
+
+
+def spectrograms(series_list, nperseg=24 * 7, noverlap=None, fs=1.0):
+    """``Spectrogram`` of every hourly series in ``series_list``, computed together.
+
+    Series shorter than one window give ``None``.
+    """
+    noverlap = nperseg // 2 if noverlap is None else noverlap
+    prepared = [_hourly_values(s) for s in series_list]
+    keys = [_key(v, start, nperseg, noverlap, fs) for v, start in prepared]
+
+    results = [None] * len(series_list)
+    todo = []
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            if key in _cache:
+                _cache.move_to_end(key)
+                results[i] = _cache[key]
+            elif len(prepared[i][0]) >= nperseg:
+                todo.append(i)
+    if not todo:
+        return results
+
+    window = get_window("hann", nperseg)
+    scale = 1.0 / (fs * (window ** 2).sum())
+    freqs = np.fft.rfftfreq(nperseg, d=1.0 / fs)
+
+    # Every window of every series is transformed in chunks of CHUNK rows
+    # through one reused buffer; a single matrix of all windows falls out of
+    # the CPU caches and is slower than scipy's per-series loop.
+    blocks = [_windows(prepared[i][0], nperseg, noverlap) for i in todo]
+    power = np.empty((sum(len(b) for b in blocks), len(freqs)))
+    buffer = np.empty((min(CHUNK, len(power)), nperseg))
+    offset = 0
+    for block in blocks:
+        for first in range(0, len(block), CHUNK):
+            part = block[first:first + CHUNK]
+            n = len(part)
+            segments = np.subtract(part, part.mean(axis=1, keepdims=True), out=buffer[:n])
+            segments *= window
+            spectrum = np.fft.rfft(segments, axis=1)
+            out = np.multiply(spectrum.real, spectrum.real, out=power[offset:offset + n])
+            out += spectrum.imag ** 2
+            offset += n
+    power *= scale
+    # One-sided spectrum: double everything but DC (and Nyquist for even windows)
+    power[:, 1:-1 if nperseg % 2 == 0 else None] *= 2
+
+    offset = 0
+    step = pd.Timedelta(hours=(nperseg - noverlap) / fs)
+    for i, block in zip(todo, blocks):
+        n = len(block)
+        start = prepared[i][1] + pd.Timedelta(hours=nperseg / 2 / fs)
+        times = pd.date_range(start, periods=n, freq=step)
+        result = Spectrogram(freqs, times, power[offset:offset + n].T)
+        offset += n
+        results[i] = result
+        with _cache_lock:
+            _cache[keys[i]] = result
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return results
+
+
+def spectrogram(series, nperseg=24 * 7, noverlap=None, fs=1.0):
+    """``Spectrogram`` of one hourly series (see ``spectrograms``)."""
+    return spectrograms([series], nperseg, noverlap, fs)[0]
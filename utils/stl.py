@@ -0,0 +1,163 @@
+"""
+STL decompositions, computed once and stored by content.
+
+Each decomposition is keyed by a hash of the regularised hourly series
+(timestamps and values) together with the STL parameters, and written to
+
+    .stl_store/3f/3f9c...e1.parquet      (observed, trend, seasonal, resid)
+
+so the same series with the same parameters is never decomposed twice,
+whichever page, session or process asks for it. A new Elhub sync changes
+the values, hence the key, and simply produces a new entry.
+
+``python -m utils.stl`` fills the store for every pricearea × productiongroup
+series of ``example.data`` (and their total) at the ``COMMON_PERIODS`` on a
+process pool.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.seasonal import STL
+
+from utils.elhub import EXAMPLE, aggregate, distinct_values
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = Path(os.environ.get("STL_STORE", ".stl_store"))
+
+# Daily and weekly cycles of hourly production
+COMMON_PERIODS = [24, 24 * 7]
+COMPONENTS = ["observed", "trend", "seasonal", "resid"]
+
+
+# ======================================================
+# Series
+# ======================================================
+def load_series(collection, area=None, group=None):
+    """Hourly quantitykwh for one price area and production group, or summed over all of them.
+
+    Duplicates are summed inside MongoDB, so only one value per hour is transferred.
+    """
+    areas = None if area is None else [area]
+    groups = None if group is None else [group]
+    df = aggregate(collection, "productiongroup", by=["starttime"], dedupe="sum",
+                   areas=areas, groups=groups)
+    return df.set_index("starttime")["quantitykwh"]
+
+
+def prepare_series(series):
+    """Sorted, UTC, regular hourly series with gaps interpolated in time."""
+    series = series.sort_index()
+    if series.index.tz is not None:
+        series = series.tz_convert("UTC")
+    else:
+        series.index = series.index.tz_localize("UTC")
+    series = series.asfreq("h")
+    return series.interpolate(method="time")
+
+
+def series_key(series, period, robust=True):
+    """Content hash of a prepared series and the STL parameters."""
+    h = hashlib.sha256()
+    h.update(series.index.asi8.tobytes())
+    h.update(series.to_numpy(dtype=np.float64).tobytes())
+    h.update(json.dumps({"period": int(period), "robust": bool(robust)}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _entry_path(key):
+    return STORE_DIR / key[:2] / f"{key}.parquet"
+
+
+# ======================================================
+# Decomposition
+# ======================================================
+def _fit(series, period, robust):
+    result = STL(series, period=int(period), robust=robust).fit()
+    return pd.DataFrame({
+        "observed": result.observed,
+        "trend": result.trend,
+        "seasonal": result.seasonal,
+        "resid": result.resid,
+    }, index=series.index)
+
+
+def decompose(series, period=24 * 7, robust=True):
+    """STL components of a series, from the store when this exact input was seen before.
+
+    ``series`` is regularised with ``prepare_series`` first, as the page
+    always did.
+    """
+    series = prepare_series(series)
+    key = series_key(series, period, robust)
+    path = _entry_path(key)
+    if path.exists():
+        return pd.read_parquet(path)
+
+    components = _fit(series, period, robust)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    components.to_parquet(tmp)
+    os.replace(tmp, path)
+    return components
+
+
+def is_stored(series, period=24 * 7, robust=True):
+    return _entry_path(series_key(prepare_series(series), period, robust)).exists()
+
+
+def _decompose_job(args):
+    name, series, period, robust = args
+    t0 = time.perf_counter()
+    decompose(series, period, robust)
+    return name, period, time.perf_counter() - t0
+
+
+def decompose_many(named_series, periods=COMMON_PERIODS, robust=True, max_workers=None):
+    """Fill the store for every ``{name: series}`` × period on a process pool.
+
+    Entries already stored are skipped. Returns ``[(name, period, seconds)]``
+    for the decompositions that were computed.
+    """
+    jobs = [(name, s, p, robust)
+            for name, s in named_series.items()
+            for p in periods
+            if not is_stored(s, p, robust)]
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        return list(pool.map(_decompose_job, jobs))
+
+
+def all_series(collection):
+    """``{(area, group): series}`` for every combination with data, plus ``(None, None)`` for the total."""
+    named = {(None, None): load_series(collection)}
+    for area in distinct_values(collection, "pricearea"):
+        for group in distinct_values(collection, "productiongroup"):
+            s = load_series(collection, area, group)
+            if not s.empty:
+                named[(area, group)] = s
+    return named
+
+
+if __name__ == "__main__":
+    from utils.mongo import get_database
+
+    logging.basicConfig(level=logging.INFO)
+    database, collection, _ = EXAMPLE
+    named = all_series(get_database(database)[collection])
+    t0 = time.perf_counter()
+    done = decompose_many(named)
+    for name, period, seconds in done:
+        print(f"{name} period={period}: {seconds:.1f}s")
+    print(f"{len(done)} decompositions computed, "
+          f"{len(named) * len(COMMON_PERIODS) - len(done)} already stored, "
+          f"{time.perf_counter() - t0:.1f}s")
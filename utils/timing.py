@@ -0,0 +1,292 @@
+"""
+Per-page latency instrumentation.
+
+Every page run is a *trace*. Each instrumented loader, analysis function or
+chart inside it is a *span* tagged with a stage:
+
+    fetch     MongoDB, Open-Meteo, the local Parquet stores
+    parse     turning responses into frames
+    compute   pandas reductions, STL, LOF, spectrograms ...
+    render    building and sending matplotlib / plotly / Altair / folium output
+
+A span records wall time, cache hit or miss (for ``cached`` functions) and
+the payload size of its result. A page uses it like this:
+
+    trace = page_trace("Map")                       # top of the page
+
+    @cached("fetch", st.cache_data(ttl=3600))        # instead of @st.cache_data(...)
+    def load(...): ...
+
+    @timed("compute")
+    def analyse(...): ...
+
+    with span("render", "choropleth") as s:
+        st_folium(fig, ...)
+        s.payload(fig)
+
+    render_timing_panel(trace)                       # bottom of the page
+
+The sidebar panel (off by default) shows the breakdown of the current run.
+With ``PAGE_TIMING_LOG=spans.jsonl`` every finished span is also appended
+as one JSON line. The field names follow OpenTelemetry's span model
+(``trace_id``, ``span_id``, ``parent_span_id``, ``start_time_unix_nano``,
+``attributes``), so the file can be loaded into pandas or converted for an
+OTLP collector.
+"""
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+STAGES = ["fetch", "parse", "compute", "render"]
+TIMING_LOG = os.environ.get("PAGE_TIMING_LOG")
+# Reruns kept per session for the panel's download
+HISTORY_SIZE = 50
+
+_trace = contextvars.ContextVar("page_trace", default=None)
+_open_span = contextvars.ContextVar("open_span", default=None)
+_log_lock = threading.Lock()
+
+
+def _new_id(n_bytes):
+    return secrets.token_hex(n_bytes)
+
+
+# ======================================================
+# Payload size
+# ======================================================
+def payload_size(obj):
+    """Approximate size in bytes of a loader result or chart, or ``None`` if unknown."""
+    if obj is None:
+        return None
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        size = obj.memory_usage(deep=True)
+        return int(size.sum() if hasattr(size, "sum") else size)
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if hasattr(obj, "to_json") and (hasattr(obj, "to_plotly_json")      # plotly: what is sent
+                                    or type(obj).__module__.startswith("altair")):
+        try:
+            return len(obj.to_json())
+        except (TypeError, ValueError):  # e.g. Period columns, which Streamlit sends as Arrow
+            return None
+    if isinstance(obj, (list, tuple)):
+        sizes = [payload_size(o) for o in obj]
+        known = [s for s in sizes if s is not None]
+        return sum(known) if known else None
+    if isinstance(obj, dict):
+        try:
+            return len(json.dumps(obj, default=str))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+# ======================================================
+# Spans and traces
+# ======================================================
+class Span:
+    """One timed stage of a page run."""
+
+    def __init__(self, trace, stage, name, parent=None, **attributes):
+        self.trace = trace
+        self.stage = stage
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_span_id = parent.span_id if parent is not None else None
+        self.cache = attributes.pop("cache", None)
+        self.payload_bytes = None
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter()
+        self.duration_ms = None
+
+    def payload(self, obj):
+        """Record the size of what this stage produced or sent."""
+        if self.trace is not None and self.trace.detailed:
+            self.payload_bytes = payload_size(obj)
+        return obj
+
+    def finish(self, error=None):
+        self.duration_ms = 1000 * (time.perf_counter() - self._t0)
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = repr(error)
+
+    def to_record(self):
+        """The span as an OpenTelemetry-shaped dict."""
+        attributes = {"page": self.trace.page if self.trace else None, "stage": self.stage,
+                      "duration_ms": round(self.duration_ms, 3)}
+        if self.cache is not None:
+            attributes["cache"] = self.cache
+        if self.payload_bytes is not None:
+            attributes["payload_bytes"] = self.payload_bytes
+        attributes.update(self.attributes)
+        return {
+            "trace_id": self.trace.trace_id if self.trace else None,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.start_ns + int(self.duration_ms * 1e6),
+            "status": self.status,
+            "attributes": attributes,
+        }
+
+
+class Trace:
+    """All spans of one page run."""
+
+    def __init__(self, page, detailed=False):
+        self.page = page
+        self.trace_id = _new_id(16)
+        self.detailed = detailed or bool(TIMING_LOG)
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter()
+        self.spans = []
+
+    def elapsed_ms(self):
+        return 1000 * (time.perf_counter() - self._t0)
+
+    def records(self):
+        return [s.to_record() for s in self.spans]
+
+    def frame(self):
+        """Finished spans as a table (one row per span)."""
+        rows = [{
+            "stage": s.stage,
+            "name": s.name,
+            "ms": round(s.duration_ms, 1),
+            "cache": s.cache or "",
+            "payload_kB": None if s.payload_bytes is None else round(s.payload_bytes / 1024, 1),
+            "nested": s.parent_span_id is not None,
+        } for s in self.spans]
+        return pd.DataFrame(rows, columns=["stage", "name", "ms", "cache", "payload_kB", "nested"])
+
+    def by_stage(self):
+        """Wall time per stage, counting only top-level spans (nested ones are inside them)."""
+        df = self.frame()
+        top = df[~df["nested"]]
+        return top.groupby("stage")["ms"].sum().reindex(STAGES, fill_value=0.0)
+
+
+def start_trace(page, detailed=False):
+    """Begin a new trace for this run; spans opened afterwards in this thread belong to it."""
+    trace = Trace(page, detailed)
+    _trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def _write_log(record):
+    with _log_lock:
+        with open(TIMING_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+
+class span:
+    """Context manager timing one stage of the current page run.
+
+    Outside a trace (background threads, CLI runs) it still times the block
+    but records nothing.
+    """
+
+    def __init__(self, stage, name, **attributes):
+        self.stage = stage
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.span = Span(_trace.get(), self.stage, self.name, _open_span.get(), **self.attributes)
+        self._token = _open_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _open_span.reset(self._token)
+        s = self.span
+        s.finish(exc)
+        if s.trace is not None:
+            s.trace.spans.append(s)
+            if TIMING_LOG:
+                _write_log(s.to_record())
+        return False
+
+
+def timed(stage, name=None):
+    """Decorator: run the function inside a ``span`` and record the size of its result."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, name or fn.__name__) as s:
+                return s.payload(fn(*args, **kwargs))
+        return wrapper
+    return decorate
+
+
+def cached(stage, cache, name=None):
+    """Decorator: ``cache`` (e.g. ``st.cache_data(ttl=3600)``) with hit/miss recorded.
+
+    The call is timed as one span. The span is marked as a miss when the
+    function body actually runs under the cache, otherwise as a hit.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def compute(*args, **kwargs):
+            current = _open_span.get()
+            if current is not None:
+                current.cache = "miss"
+            return fn(*args, **kwargs)
+
+        cached_fn = cache(compute)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, name or fn.__name__, cache="hit") as s:
+                return s.payload(cached_fn(*args, **kwargs))
+
+        wrapper.clear = cached_fn.clear
+        return wrapper
+    return decorate
+
+
+# ======================================================
+# Streamlit surface
+# ======================================================
+def page_trace(page):
+    """``start_trace`` for a Streamlit page; payload sizes are measured when the panel is on."""
+    import streamlit as st
+    return start_trace(page, detailed=bool(st.session_state.get("_timing_panel", False)))
+
+
+def render_timing_panel(trace):
+    """Sidebar toggle with the stage breakdown of this run and a JSONL download of recent runs."""
+    import streamlit as st
+
+    history = st.session_state.setdefault("_timing_history", [])
+    history.append(trace.records())
+    del history[:-HISTORY_SIZE]
+
+    if not st.sidebar.toggle("Show page timings", key="_timing_panel"):
+        return
+    with st.sidebar.expander(f"⏱️ {trace.page}: {trace.elapsed_ms():.0f} ms this run", expanded=True):
+        stages = trace.by_stage()
+        st.bar_chart(stages, horizontal=True, height=160)
+        st.dataframe(trace.frame().drop(columns="nested"), hide_index=True, use_container_width=True)
+        st.download_button(
+            "Download spans (JSONL)",
+            "".join(json.dumps(r, default=str) + "\n" for run in history for r in run),
+            file_name="page_spans.jsonl",
+            mime="application/x-ndjson",
+        )
@@ -0,0 +1,335 @@
+"""
+ERA5 weather access shared by every page.
+
+Hourly data is fetched once from the Open-Meteo archive and written to a
+local Parquet store partitioned by location and year, together with the
+July–June ``season`` label of every hour:
+
+    .era5_store/lat=59.9139_lon=10.7522/tz=Europe-Oslo/year=2021.parquet
+    .era5_store/lat=59.9139_lon=10.7522/tz=Europe-Oslo/coverage.json
+
+``coverage.json`` records which local date spans have been fetched, so a
+request for any date range only goes to the network for the gaps, one
+request per contiguous gap. A cold process reads typed columns straight
+from disk.
+"""
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests_cache
+import openmeteo_requests
+from retry_requests import retry
+
+ARCHIVE_URL = os.environ.get("OPENMETEO_ARCHIVE_URL", "https://archive-api.open-meteo.com/v1/archive")
+STORE_DIR = Path(os.environ.get("ERA5_STORE", ".era5_store"))
+# ERA5 is published about five days behind real time; later days are never requested
+ARCHIVE_LAG = pd.Timedelta(days=int(os.environ.get("ERA5_LAG_DAYS", 5)))
+PARTITION_CACHE_SIZE = 64
+
+# One representative city per Elhub price area
+price_areas = [
+    {"price_area": "NO1", "city": "Oslo", "latitude": 59.9139, "longitude": 10.7522},
+    {"price_area": "NO2", "city": "Kristiansand", "latitude": 58.1467, "longitude": 7.9956},
+    {"price_area": "NO3", "city": "Trondheim", "latitude": 63.4305, "longitude": 10.3951},
+    {"price_area": "NO4", "city": "Tromsø", "latitude": 69.6492, "longitude": 18.9553},
+    {"price_area": "NO5", "city": "Bergen", "latitude": 60.3913, "longitude": 5.3221},
+]
+
+HOURLY_VARIABLES = [
+    "temperature_2m",
+    "precipitation",
+    "wind_speed_10m",
+    "wind_gusts_10m",
+    "wind_direction_10m",
+]
+
+
+# ======================================================
+# Open-Meteo client
+# ======================================================
+@lru_cache(maxsize=1)
+def get_client():
+    """One retrying Open-Meteo client (and one HTTP cache file) per process.
+
+    Complete days live in the Parquet store, so the HTTP cache only has to
+    absorb reruns for the most recent, still-growing days.
+    """
+    cache_session = requests_cache.CachedSession(".cache", expire_after=3600)
+    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
+    return openmeteo_requests.Client(session=retry_session)
+
+
+def fetch_era5(lat, lon, start_date, end_date, timezone="Europe/Oslo"):
+    """Fetch hourly ERA5 data for [start_date, end_date] (local dates).
+
+    Returns a float32 frame indexed by a UTC DatetimeIndex named ``time``.
+    """
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "start_date": str(start_date),
+        "end_date": str(end_date),
+        "hourly": HOURLY_VARIABLES,
+        "models": "era5",
+        "timezone": timezone,
+    }
+    response = get_client().weather_api(ARCHIVE_URL, params=params)[0]
+    return hourly_frame(response, HOURLY_VARIABLES)
+
+
+def hourly_frame(response, variables=HOURLY_VARIABLES):
+    """Hourly block of a binary (FlatBuffers) Open-Meteo response as a frame.
+
+    Values are read as NumPy arrays straight from the message, and the UTC
+    time axis is built arithmetically from ``Time()``, ``TimeEnd()`` and
+    ``Interval()``; no timestamp strings are parsed.
+    """
+    hourly = response.Hourly()
+    seconds = np.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval(), dtype=np.int64)
+    index = pd.DatetimeIndex(seconds.astype("datetime64[s]"), name="time").tz_localize("UTC")
+    data = {
+        name: hourly.Variables(i).ValuesAsNumpy()
+        for i, name in enumerate(variables)
+    }
+    return pd.DataFrame(data, index=index)
+
+
+# ======================================================
+# Parquet store
+# ======================================================
+def location_dir(lat, lon, timezone="Europe/Oslo"):
+    """Directory holding every partition of one (location, timezone)."""
+    location = f"lat={float(lat):.4f}_lon={float(lon):.4f}"
+    tz = "tz=" + timezone.replace("/", "-")
+    return STORE_DIR / location / tz
+
+
+def partition_path(lat, lon, year, timezone="Europe/Oslo"):
+    """Location of the Parquet file holding one (location, year) partition."""
+    return location_dir(lat, lon, timezone) / f"year={int(year)}.parquet"
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _location_lock(directory):
+    with _locks_guard:
+        return _locks.setdefault(directory, threading.Lock())
+
+
+def _read_coverage(directory):
+    """Fetched date spans of one location, as a sorted list of (start, end) dates."""
+    path = directory / "coverage.json"
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [(pd.Timestamp(a), pd.Timestamp(b)) for a, b in json.load(f)]
+
+
+def _write_coverage(directory, spans):
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = directory / f"coverage.json.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump([[a.date().isoformat(), b.date().isoformat()] for a, b in spans], f)
+    os.replace(tmp, directory / "coverage.json")
+
+
+def merge_spans(spans):
+    """Union of inclusive date spans; adjacent days are joined into one span."""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + pd.Timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_spans(start, end, covered):
+    """Contiguous date spans inside [start, end] that ``covered`` does not contain."""
+    gaps = []
+    cursor = start
+    for a, b in merge_spans(covered):
+        if b < cursor:
+            continue
+        if a > end:
+            break
+        if a > cursor:
+            gaps.append((cursor, a - pd.Timedelta(days=1)))
+        cursor = max(cursor, b + pd.Timedelta(days=1))
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def api_call_weight(start, end, n_variables=len(HOURLY_VARIABLES)):
+    """How many calls Open-Meteo bills for one request.
+
+    Requests spanning more than two weeks or more than ten variables count
+    as several calls.
+    """
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    return max(1, math.ceil(days / 14)) * max(1, math.ceil(n_variables / 10))
+
+
+def _complete_until(df, timezone):
+    """Last local date whose 24 hours are all present in the archive response.
+
+    ERA5 lags real time by several days and the API pads recent hours with
+    NaN, so only complete days are marked as covered.
+    """
+    valid = df.index[df["temperature_2m"].notna()]
+    if valid.empty:
+        return None
+    last = valid[-1].tz_convert(timezone)
+    day = last.tz_localize(None).normalize()
+    return day if last.hour == 23 else day - pd.Timedelta(days=1)
+
+
+def season_labels(index):
+    """July–June season of each timestamp, labelled by its starting year."""
+    return np.where(index.month >= 7, index.year, index.year - 1).astype("int16")
+
+
+def _merge_into_partitions(directory, df, timezone):
+    """Upsert a fetched span into the per-year partitions it touches.
+
+    A partition that already holds exactly these rows is left as it is.
+    """
+    years = df.index.tz_convert(timezone).year
+    for year in years.unique():
+        path = directory / f"year={int(year)}.parquet"
+        part = df[years == year]
+        if path.exists():
+            stored = pd.read_parquet(path)
+            if stored.reindex(part.index)[part.columns].equals(part):
+                continue
+            part = pd.concat([stored, part])
+            part = part[~part.index.duplicated(keep="last")].sort_index()
+        # Labelled here, once, so readers never have to derive it per row
+        part = part.assign(season=season_labels(part.index.tz_convert(timezone)))
+        directory.mkdir(parents=True, exist_ok=True)
+        # Unique per writer: the server and a batch process may write the same partition
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        part.to_parquet(tmp)
+        os.replace(tmp, path)
+        _evict_partition(path)
+
+
+def _empty_frame(timezone, columns=HOURLY_VARIABLES):
+    index = pd.DatetimeIndex([], tz=timezone, name="time")
+    return pd.DataFrame({c: pd.Series(index=index, dtype="int16" if c == "season" else "float32")
+                         for c in columns}, index=index)
+
+
+_partitions = OrderedDict()
+_partitions_lock = threading.Lock()
+
+
+def _read_partition(path, mtime, timezone):
+    """One partition as read from disk, cached per (path, timezone) until its mtime changes."""
+    key = (path, timezone)
+    with _partitions_lock:
+        hit = _partitions.get(key)
+        if hit is not None and hit[0] == mtime:
+            _partitions.move_to_end(key)
+            return hit[1]
+    df = pd.read_parquet(path)
+    if "season" not in df.columns:
+        # Partitions written before seasons were stored
+        df["season"] = season_labels(df.index.tz_convert(timezone))
+    with _partitions_lock:
+        _partitions[key] = (mtime, df)
+        _partitions.move_to_end(key)
+        while len(_partitions) > PARTITION_CACHE_SIZE:
+            _partitions.popitem(last=False)
+    return df
+
+
+def _evict_partition(path):
+    """Drop the cached frames of one rewritten partition; other locations stay cached."""
+    with _partitions_lock:
+        for key in [k for k in _partitions if k[0] == path]:
+            del _partitions[key]
+
+
+def fill_gaps(lat, lon, start_date, end_date, timezone="Europe/Oslo", limiter=None):
+    """Fetch only the parts of [start_date, end_date] the store has not seen.
+
+    Each missing contiguous span costs one request, whatever its length.
+    Days within ``ARCHIVE_LAG`` of today are not requested: the archive has
+    no data for them yet, so fetching them would only repeat on every call.
+    ``limiter`` is an optional ``utils.prefetch.TokenBucket`` that is charged
+    the Open-Meteo call weight of every request before it is sent.
+    Returns the number of requests that were made.
+    """
+    directory = location_dir(lat, lon, timezone)
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    today = pd.Timestamp.now(tz=timezone).tz_localize(None).normalize()
+    end = min(end, today - ARCHIVE_LAG)
+    if end < start:
+        return 0
+
+    with _location_lock(directory):
+        covered = _read_coverage(directory)
+        gaps = missing_spans(start, end, covered)
+        for gap_start, gap_end in gaps:
+            if limiter is not None:
+                limiter.acquire(api_call_weight(gap_start, gap_end))
+            df = fetch_era5(lat, lon, gap_start.date(), gap_end.date(), timezone)
+            _merge_into_partitions(directory, df, timezone)
+            complete = _complete_until(df, timezone)
+            if complete is not None and complete >= gap_start:
+                covered.append((gap_start, min(gap_end, complete)))
+        if gaps:
+            _write_coverage(directory, merge_spans(covered))
+    return len(gaps)
+
+
+def load_era5_range(lat, lon, start_date, end_date, timezone="Europe/Oslo", fetch=True,
+                    columns=HOURLY_VARIABLES):
+    """Hourly ERA5 data for the local dates [start_date, end_date], inclusive.
+
+    Missing spans are fetched first (see ``fill_gaps``) unless ``fetch`` is
+    False; the result is then read from the Parquet partitions as one
+    contiguous, sorted frame indexed in ``timezone``. ``columns`` may add the
+    stored ``"season"`` label to the weather variables. The end date is
+    clipped to today. The caller gets its own copy and may modify it freely.
+    """
+    lat, lon = round(float(lat), 4), round(float(lon), 4)
+    today = pd.Timestamp.now(tz=timezone).tz_localize(None).normalize()
+    start = pd.Timestamp(start_date).normalize()
+    end = min(pd.Timestamp(end_date).normalize(), today)
+    if end < start:
+        return _empty_frame(timezone, columns)
+
+    if fetch:
+        fill_gaps(lat, lon, start, end, timezone)
+
+    parts = []
+    for year in range(start.year, end.year + 1):
+        path = partition_path(lat, lon, year, timezone)
+        if path.exists():
+            parts.append(_read_partition(path, path.stat().st_mtime_ns, timezone)[list(columns)])
+    if not parts:
+        return _empty_frame(timezone, columns)
+
+    df = pd.concat(parts)
+    df.index = df.index.tz_convert(timezone)
+    lo = start.tz_localize(timezone)
+    hi = (end + pd.Timedelta(days=1)).tz_localize(timezone)
+    return df[(df.index >= lo) & (df.index < hi)].copy()
+
+
+def download_era5_openmeteo(lat, lon, year=2021, timezone="Europe/Oslo"):
+    """Hourly ERA5 data for one location and calendar year."""
+    return load_era5_range(lat, lon, f"{year}-01-01", f"{year}-12-31", timezone)